@@ -1,40 +1,189 @@
 """
 成绩导入转换工具 - Web UI 版本
 基于 Flask 的现代化 Web 应用
+
+开发: python app.py
+生产: gunicorn -c gunicorn.conf.py wsgi:app（见 README "Web 版部署"）
 """
 import os
 import sys
 import io
+import uuid
 from pathlib import Path
-from flask import Flask, render_template, request, jsonify, send_file
+from typing import Dict, Optional
+from flask import Blueprint, Flask, current_app, render_template, request, jsonify, send_file
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 from excel_handler import ExcelHandler
+from conversion_jobs import JobManager, UploadStore, JOB_DONE, JOB_FAILED
+from result_cache import ResultCache
+from storage_janitor import StorageJanitor
 
 # 配置
 UPLOAD_FOLDER = 'uploads'
 DOWNLOAD_FOLDER = 'downloads'
 ALLOWED_EXTENSIONS = {'xls', 'xlsx'}
+CONVERT_WORKERS = int(os.environ.get('CONVERT_WORKERS', 2))  # 同时进行的转换任务数
+# 大于 0 时转换在独立的进程池中执行（可利用多核），任务数等于进程数
+CONVERT_PROCESSES = int(os.environ.get('CONVERT_PROCESSES', 0))
+# 内存模式：上传内容和转换结果只保存在内存中，不经过 uploads/ 和 downloads/
+IN_MEMORY_MODE = os.environ.get('IN_MEMORY_MODE', '0') == '1'
+# 转换结果缓存：相同内容和选项的文件直接返回已有结果
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_MB', 512)) * 1024 * 1024
+CACHE_MAX_AGE = float(os.environ.get('CACHE_MAX_AGE_HOURS', 7 * 24)) * 3600
+# 临时文件保存期限和总配额（后台定期清理）
+UPLOAD_TTL = float(os.environ.get('UPLOAD_TTL_MINUTES', 60)) * 60
+DOWNLOAD_TTL = float(os.environ.get('DOWNLOAD_TTL_MINUTES', 24 * 60)) * 60
+STORAGE_MAX_BYTES = int(os.environ.get('STORAGE_MAX_MB', 1024)) * 1024 * 1024
+CLEANUP_INTERVAL = float(os.environ.get('CLEANUP_INTERVAL_SECONDS', 300))
+# 前端可以传入的转换选项（见 ExcelHandler.write_excel_file）
+CONVERT_OPTIONS = ('top_n', 'top_subjects', 'top_ties', 'min_exams', 'exam_order', 'top_exam',
+                   'output_format')
+MIMETYPES = {
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+}
+
+DEFAULT_CONFIG = {
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'DOWNLOAD_FOLDER': DOWNLOAD_FOLDER,
+    'MAX_CONTENT_LENGTH': 50 * 1024 * 1024,  # 50MB 限制
+    'IN_MEMORY_MODE': IN_MEMORY_MODE,
+    'CONVERT_WORKERS': CONVERT_WORKERS,
+    'CONVERT_PROCESSES': CONVERT_PROCESSES,
+    'CACHE_MAX_BYTES': CACHE_MAX_BYTES,
+    'CACHE_MAX_AGE': CACHE_MAX_AGE,
+    'UPLOAD_TTL': UPLOAD_TTL,
+    'DOWNLOAD_TTL': DOWNLOAD_TTL,
+    'STORAGE_MAX_BYTES': STORAGE_MAX_BYTES,
+    'CLEANUP_INTERVAL': CLEANUP_INTERVAL,
+    'START_JANITOR': True,
+}
+
+bp = Blueprint('main', __name__)
+
+
+def create_app(config: Optional[Dict] = None) -> Flask:
+    """
+    创建 Flask 应用
+    任务队列、结果缓存和清理线程随应用创建，每个进程一份；
+    config 覆盖 DEFAULT_CONFIG 中的配置
+    """
+    app = Flask(__name__)
+    app.config.from_mapping(DEFAULT_CONFIG)
+    if config:
+        app.config.from_mapping(config)
+    
+    # 创建文件夹
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
+    
+    # 转换任务在后台线程池（或进程池）中执行，请求立即返回任务 ID
+    # 内存模式下结果缓存也只保存在内存中，不写 downloads/
+    cache_dir = None if app.config['IN_MEMORY_MODE'] else os.path.join(app.config['DOWNLOAD_FOLDER'], '.cache')
+    result_cache = ResultCache(cache_dir, max_bytes=app.config['CACHE_MAX_BYTES'],
+                               max_age=app.config['CACHE_MAX_AGE'])
+    jobs = JobManager(max_workers=app.config['CONVERT_WORKERS'],
+                      processes=app.config['CONVERT_PROCESSES'], cache=result_cache)
+    
+    # 后台清理 uploads/ 和 downloads/，跳过正在转换的文件
+    janitor = StorageJanitor(
+        {app.config['UPLOAD_FOLDER']: app.config['UPLOAD_TTL'],
+         app.config['DOWNLOAD_FOLDER']: app.config['DOWNLOAD_TTL']},
+        max_bytes=app.config['STORAGE_MAX_BYTES'],
+        interval=app.config['CLEANUP_INTERVAL'],
+        in_use=jobs.in_use,
+        on_remove=ExcelHandler.workbook_cache.discard
+    )
+    if app.config['START_JANITOR']:
+        janitor.start()
+    
+    app.extensions['score_convert'] = {
+        'jobs': jobs,
+        'result_cache': result_cache,
+        # 内存模式下上传的工作簿
+        'memory_uploads': UploadStore(),
+        'janitor': janitor,
+    }
+    app.register_blueprint(bp)
+    return app
+
+
+def service(name):
+    """当前应用的任务队列、缓存等（见 create_app）"""
+    return current_app.extensions['score_convert'][name]
+
+def make_work_dir(folder):
+    """每次上传/转换一个独立目录，同名文件并发处理时互不覆盖"""
+    work_dir = os.path.join(folder, uuid.uuid4().hex)
+    os.makedirs(work_dir)
+    return work_dir
 
-# 创建文件夹
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(DOWNLOAD_FOLDER, exist_ok=True)
+def within_folder(path, folder):
+    """路径是否位于指定目录内（防止通过参数删除其他文件）"""
+    folder = os.path.abspath(folder)
+    return os.path.commonpath([os.path.abspath(path), folder]) == folder
 
-# 创建 Flask 应用
-app = Flask(__name__)
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['DOWNLOAD_FOLDER'] = DOWNLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB 限制
+def output_name(input_filename, options):
+    """输出文件名：转换_<原文件名>，扩展名与输出格式一致"""
+    base_name = os.path.splitext(input_filename)[0]
+    return f"转换_{base_name}.{options.get('output_format', 'xls')}"
+
+def validate_options(options):
+    """检查转换选项的类型和取值范围（见 ExcelHandler.write_excel_file），返回错误信息，没有问题时返回 None"""
+    def is_int(value, minimum):
+        return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+    def is_names(value):
+        return isinstance(value, list) and len(value) > 0 and \
+            all(isinstance(item, str) and item.strip() for item in value)
+
+    if 'top_n' in options and not is_int(options['top_n'], 1):
+        return 'top_n 必须是正整数'
+    if 'top_subjects' in options:
+        top_subjects = options['top_subjects']
+        if not is_names(top_subjects) or len(set(top_subjects)) != len(top_subjects):
+            return 'top_subjects 必须是不重复的科目名称列表，如 ["总分", "数学"]'
+    if 'top_ties' in options and options['top_ties'] not in ExcelHandler.TOP_TIES:
+        return f"top_ties 只能是 {'、'.join(ExcelHandler.TOP_TIES)}"
+    if options.get('min_exams') is not None and not is_int(options['min_exams'], 1):
+        return 'min_exams 必须是正整数'
+    if 'exam_order' in options:
+        exam_order = options['exam_order']
+        if not is_names(exam_order) or len(set(exam_order)) != len(exam_order):
+            return 'exam_order 必须是不重复的考试名称关键字列表，如 ["一调", "期中"]'
+    if 'top_exam' in options and not is_int(options['top_exam'], 0):
+        return 'top_exam 必须是非负整数（从 0 开始的考试序号）'
+    if options.get('output_format', 'xls') not in ExcelHandler.OUTPUT_FORMATS:
+        return '不支持的输出格式'
+    return None
+
+def validate_exam_count(workbook, options):
+    """
+    工作簿中的考试数已知（上传时读过工作表名称）时，检查 top_exam 是否超出范围；
+    未知时由转换任务报错
+    """
+    if workbook.sheet_names is None or 'top_exam' not in options:
+        return None
+    exam_order = options.get('exam_order') or ExcelHandler.EXAM_KEYWORDS
+    exam_count = sum(1 for name in workbook.sheet_names if any(keyword in name for keyword in exam_order))
+    if options['top_exam'] >= exam_count:
+        return f"top_exam 超出范围：文件中只有 {exam_count} 次考试（从 0 开始）"
+    return None
+
+def mimetype_for(filename):
+    return MIMETYPES.get(filename.rsplit('.', 1)[-1].lower(), MIMETYPES['xls'])
 
 def allowed_file(filename):
     """检查文件是否允许"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/')
+@bp.route('/')
 def index():
     """主页"""
     return render_template('index.html')
 
-@app.route('/api/info', methods=['GET'])
+@bp.route('/api/info', methods=['GET'])
 def get_info():
     """获取应用信息"""
     return jsonify({
@@ -43,7 +192,7 @@ def get_info():
         'description': '将包含两次考试数据的 Excel 文件转换为标准的8工作表格式'
     })
 
-@app.route('/api/upload', methods=['POST'])
+@bp.route('/api/upload', methods=['POST'])
 def upload_file():
     """上传文件"""
     try:
@@ -59,13 +208,21 @@ def upload_file():
         if not allowed_file(file.filename):
             return jsonify({'success': False, 'error': '不支持的文件格式，请上传 .xls 或 .xlsx 文件'}), 400
         
-        # 保存文件
+        # secure_filename 会去掉中文，纯中文文件名只剩扩展名时改用默认名
+        extension = file.filename.rsplit('.', 1)[1].lower()
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        if not filename.lower().endswith(f'.{extension}') or filename.startswith('.') or filename == extension:
+            filename = f'upload.{extension}'
+        
+        if current_app.config['IN_MEMORY_MODE']:
+            return upload_to_memory(file, filename)
+        
+        # 保存到本次上传独立的目录中
+        filepath = os.path.join(make_work_dir(current_app.config['UPLOAD_FOLDER']), filename)
         file.save(filepath)
         
-        # 获取文件信息
-        info = ExcelHandler.get_file_info(filepath)
+        # 获取文件信息（转换在子进程中进行时不缓存行数据）
+        info = ExcelHandler.get_file_info(filepath, cache_rows=not service('jobs').uses_processes)
         
         if not info['success']:
             return jsonify({'success': False, 'error': info['error']}), 400
@@ -81,110 +238,203 @@ def upload_file():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/convert', methods=['POST'])
+def upload_to_memory(file, filename):
+    """
+    内存模式：上传内容直接交给 xlrd 解码，预览时解码的工作表在转换时复用；
+    转换在子进程中进行时只读元数据（子进程从文件内容重新解码）
+    """
+    workbook = ExcelHandler.load_contents(file.read(), filename)
+    try:
+        info = workbook.info(None if service('jobs').uses_processes else ExcelHandler.EXAM_KEYWORDS)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    upload_id = service('memory_uploads').put(filename, workbook)
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'upload_id': upload_id,
+        'sheets': info['sheets'],
+        'total_sheets': info['total_sheets']
+    })
+
+@bp.route('/api/convert', methods=['POST'])
 def convert_file():
-    """转换文件"""
+    """提交转换任务，立即返回任务 ID，进度通过 /api/jobs/<job_id> 查询"""
     try:
-        data = request.json
-        input_filepath = data.get('filepath')
-        
-        if not input_filepath or not os.path.exists(input_filepath):
-            return jsonify({'success': False, 'error': '文件不存在'}), 400
-        
-        # 读取文件
-        sheets = ExcelHandler.read_excel_file(input_filepath)
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('options') or {}, dict):
+            return jsonify({'success': False, 'error': '请求格式错误'}), 400
+        options = {key: value for key, value in (data.get('options') or {}).items()
+                   if key in CONVERT_OPTIONS}
+        error = validate_options(options)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
         
-        # 生成输出文件名
-        input_filename = os.path.basename(input_filepath)
-        output_filename = f"转换_{input_filename}"
-        output_filepath = os.path.join(app.config['DOWNLOAD_FOLDER'], output_filename)
+        upload_id = data.get('upload_id')
+        if upload_id:
+            entry = service('memory_uploads').get(upload_id)
+            if entry is None:
+                return jsonify({'success': False, 'error': '文件不存在，请重新上传'}), 400
+            filename, workbook = entry
+            error = validate_exam_count(workbook, options)
+            if error:
+                return jsonify({'success': False, 'error': error}), 400
+            job_id = service('jobs').submit(workbook, output_filename=output_name(filename, options),
+                                            options=options)
+            return jsonify({
+                'success': True,
+                'job_id': job_id,
+                'status_url': f'/api/jobs/{job_id}'
+            }), 202
         
-        # 确保输出目录存在
-        os.makedirs(app.config['DOWNLOAD_FOLDER'], exist_ok=True)
-        
-        # 转换
-        ExcelHandler.write_excel_file(sheets, output_filepath)
+        input_filepath = data.get('filepath')
+        if not input_filepath or not os.path.exists(input_filepath) \
+                or not within_folder(input_filepath, current_app.config['UPLOAD_FOLDER']):
+            return jsonify({'success': False, 'error': '文件不存在'}), 400
+        error = validate_exam_count(ExcelHandler.load_workbook(input_filepath), options)
+        if error:
+            return jsonify({'success': False, 'error': error}), 400
         
-        # 验证文件是否生成
-        if not os.path.exists(output_filepath):
-            return jsonify({'success': False, 'error': '文件生成失败'}), 500
+        # 生成输出文件名，输出到本次转换独立的目录中
+        output_filename = output_name(os.path.basename(input_filepath), options)
+        output_filepath = os.path.join(make_work_dir(current_app.config['DOWNLOAD_FOLDER']), output_filename)
         
-        print(f"文件已生成: {output_filepath}")
-        print(f"文件大小: {os.path.getsize(output_filepath)} bytes")
+        job_id = service('jobs').submit(input_filepath, output_filepath, options=options)
         
         return jsonify({
             'success': True,
-            'message': '转换成功！',
-            'output_filename': output_filename,
-            'output_filepath': output_filepath
-        })
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}'
+        }), 202
     
-    except ValueError as e:
-        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
-        print(f"转换错误: {e}")
-        import traceback
-        traceback.print_exc()
         return jsonify({'success': False, 'error': f'转换失败: {str(e)}'}), 500
 
-@app.route('/api/download/<path:filename>', methods=['GET'])
+@bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """查询转换任务的状态、进度和结果文件名"""
+    job = service('jobs').get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    
+    result = {
+        'success': job['status'] != JOB_FAILED,
+        'job_id': job_id,
+        'status': job['status'],
+        'progress': job['progress'],
+        'message': job['message'],
+        'cached': job['cached'],
+        'warnings': job['warnings']
+    }
+    if job['status'] == JOB_DONE:
+        result['output_filename'] = job['output_filename']
+        if job['in_memory']:
+            result['download_url'] = f'/api/jobs/{job_id}/download'
+        else:
+            # 输出文件相对 downloads/ 的路径（含任务目录），用于下载和清理
+            output_path = os.path.relpath(job['output_filepath'], current_app.config['DOWNLOAD_FOLDER'])
+            result['output_path'] = output_path.replace(os.sep, '/')
+            result['download_url'] = f"/api/download/{quote(result['output_path'])}"
+    elif job['status'] == JOB_FAILED:
+        result['error'] = job['error']
+    return jsonify(result)
+
+@bp.route('/api/jobs/<job_id>/download', methods=['GET'])
+def download_job_result(job_id):
+    """内存模式：直接从转换结果的缓冲区返回文件"""
+    job = service('jobs').get(job_id)
+    if job is None or job['status'] != JOB_DONE or job['result'] is None:
+        return jsonify({'success': False, 'error': '文件不存在或已过期，请重新转换'}), 404
+    
+    return send_file(
+        io.BytesIO(job['result']),
+        as_attachment=True,
+        download_name=job['output_filename'],
+        mimetype=mimetype_for(job['output_filename'])
+    )
+
+@bp.route('/api/cache', methods=['GET'])
+def cache_stats():
+    """转换结果缓存的命中统计"""
+    return jsonify({'success': True, **service('result_cache').stats()})
+
+@bp.route('/api/ready', methods=['GET'])
+def ready():
+    """就绪检查：目录可写、任务队列（和进程池）可用时返回 200，否则返回 503"""
+    checks = {
+        'upload_folder': os.access(current_app.config['UPLOAD_FOLDER'], os.W_OK),
+        'download_folder': os.access(current_app.config['DOWNLOAD_FOLDER'], os.W_OK),
+        'job_queue': service('jobs').accepting,
+        'process_pool': service('jobs').pool_healthy,
+    }
+    ready = all(checks.values())
+    return jsonify({'ready': ready, 'checks': checks, 'jobs': service('jobs').stats()}), 200 if ready else 503
+
+@bp.route('/api/download/<path:filename>', methods=['GET'])
 def download_file(filename):
     """下载文件"""
     try:
-        # 直接使用 filename，不用 secure_filename
-        filepath = os.path.join(app.config['DOWNLOAD_FOLDER'], filename)
-        
-        print(f"下载请求: {filename}")
-        print(f"完整路径: {filepath}")
-        print(f"文件存在: {os.path.exists(filepath)}")
+        # filename 为 任务目录/文件名，不用 secure_filename（会去掉中文），改为限定在下载目录内
+        filepath = os.path.join(current_app.config['DOWNLOAD_FOLDER'], filename)
+        if not within_folder(filepath, current_app.config['DOWNLOAD_FOLDER']):
+            return jsonify({'success': False, 'error': '文件不存在'}), 404
         
         if not os.path.exists(filepath):
-            return jsonify({'success': False, 'error': f'文件不存在: {filepath}'}), 404
+            current_app.logger.debug("下载的文件不存在: %s", filepath)
+            return jsonify({'success': False, 'error': '文件不存在'}), 404
         
         # 确保文件可读
         if not os.access(filepath, os.R_OK):
             return jsonify({'success': False, 'error': '无权访问文件'}), 403
         
+        # 记录最近使用时间，清理时按 LRU 排在最后
+        StorageJanitor.touch(filepath)
+        
         return send_file(
             filepath,
             as_attachment=True,
-            download_name=filename,
-            mimetype='application/vnd.ms-excel'
+            download_name=os.path.basename(filename),
+            mimetype=mimetype_for(filename)
         )
     
     except Exception as e:
-        print(f"Download error: {e}")
-        import traceback
-        traceback.print_exc()
+        current_app.logger.exception("下载失败: %s", filename)
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/cleanup', methods=['POST'])
+@bp.route('/api/cleanup', methods=['POST'])
 def cleanup():
-    """清理临时文件"""
+    """清理当前用户的临时文件（只删除请求中指定的文件，正在转换的文件不删除）"""
     try:
-        # 清理上传文件夹
-        for file in os.listdir(app.config['UPLOAD_FOLDER']):
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], file)
-            if os.path.isfile(filepath):
-                os.remove(filepath)
-        
-        # 清理下载文件夹（可选）
-        # for file in os.listdir(app.config['DOWNLOAD_FOLDER']):
-        #     filepath = os.path.join(app.config['DOWNLOAD_FOLDER'], file)
-        #     if os.path.isfile(filepath):
-        #         os.remove(filepath)
-        
-        return jsonify({'success': True, 'message': '清理完成'})
+        data = request.get_json(silent=True) or {}
+        removed = 0
+        
+        filepath = data.get('filepath')
+        if filepath and within_folder(filepath, current_app.config['UPLOAD_FOLDER']):
+            removed += service('janitor').remove(filepath)
+        
+        output_path = data.get('output_path')
+        if output_path:
+            output_filepath = os.path.join(current_app.config['DOWNLOAD_FOLDER'], output_path)
+            if within_folder(output_filepath, current_app.config['DOWNLOAD_FOLDER']):
+                removed += service('janitor').remove(output_filepath)
+        
+        upload_id = data.get('upload_id')
+        if upload_id:
+            service('memory_uploads').discard(upload_id)
+        
+        # 其他文件由后台清理线程按保存期限和配额处理
+        return jsonify({'success': True, 'message': '清理完成', 'removed': removed})
     
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.errorhandler(404)
+@bp.app_errorhandler(404)
 def not_found(error):
     """404 错误处理"""
     return jsonify({'success': False, 'error': '页面不存在'}), 404
 
-@app.errorhandler(500)
+@bp.app_errorhandler(500)
 def internal_error(error):
     """500 错误处理"""
     return jsonify({'success': False, 'error': '服务器内部错误'}), 500
@@ -197,4 +447,4 @@ if __name__ == '__main__':
     print("访问地址: http://localhost:5000")
     print("按 Ctrl+C 停止服务器\n")
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,157 @@
+"""
+成绩导入转换工具 - 批量转换
+一次转换多个文件（目录或通配符），用进程池并行处理，逐个报告耗时与失败原因
+
+用法:
+    python -m batch_convert data/
+    python -m batch_convert "data/*.xls" -o downloads -j 8
+    python -m batch_convert data/ --format xlsx
+    python -m batch_convert data/ --exam-order 一调 期中 期末
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence
+
+from excel_handler import ExcelHandler
+
+ALLOWED_EXTENSIONS = {'xls', 'xlsx'}
+OUTPUT_PREFIX = '转换_'
+
+
+def collect_files(inputs: List[str]) -> List[str]:
+    """把目录、通配符和文件路径展开为待转换的文件列表（去重，跳过已转换的输出文件）"""
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = sorted(os.path.join(item, name) for name in os.listdir(item))
+        else:
+            candidates = sorted(glob.glob(item)) or [item]
+        for path in candidates:
+            name = os.path.basename(path)
+            if name.startswith(OUTPUT_PREFIX) or name.startswith('~$'):
+                continue
+            if '.' in name and name.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS:
+                files.append(os.path.abspath(path))
+    return list(dict.fromkeys(files))
+
+
+def output_path_for(input_path: str, output_dir: str, output_format: str = 'xls') -> str:
+    """输出文件名与 Web 版一致：转换_<原文件名>，扩展名与输出格式一致"""
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    return os.path.join(output_dir, f"{OUTPUT_PREFIX}{base_name}.{output_format}")
+
+
+def output_paths(files: List[str], output_dir: str, output_format: str = 'xls') -> Dict[str, str]:
+    """
+    各输入文件的输出路径
+    输入文件在不同目录时，按相对于共同上级目录的路径输出到 output_dir 下对应的子目录，
+    不同目录中的同名文件不会互相覆盖；仍然重名（如同一目录的 a.xls 和 a.xlsx）时抛出 ValueError
+    """
+    if not files:
+        return {}
+    root = os.path.commonpath([os.path.dirname(path) for path in files])
+    outputs = {}
+    for path in files:
+        sub_dir = os.path.relpath(os.path.dirname(path), root)
+        outputs[path] = os.path.normpath(output_path_for(path, os.path.join(output_dir, sub_dir), output_format))
+
+    inputs_by_output: Dict[str, List[str]] = {}
+    for path, output in outputs.items():
+        inputs_by_output.setdefault(os.path.normcase(output), []).append(path)
+    collisions = [paths for paths in inputs_by_output.values() if len(paths) > 1]
+    if collisions:
+        raise ValueError("以下文件的输出文件名相同：" + '；'.join('、'.join(paths) for paths in collisions))
+    return outputs
+
+
+def convert_one(input_path: str, output_path: str, output_format: str = 'xls',
+                exam_order: Optional[Sequence[str]] = None) -> Dict:
+    """
+    转换单个文件（在子进程中运行），exam_order 为考试顺序（名称关键字，默认 EXAM_KEYWORDS）
+
+    Returns:
+        {'input', 'output', 'success', 'read_time', 'write_time', 'error', 'warnings'}
+    """
+    result = {'input': input_path, 'output': output_path,
+              'success': False, 'read_time': 0.0, 'write_time': 0.0, 'error': '', 'warnings': []}
+    try:
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        start = time.perf_counter()
+        sheets = ExcelHandler.read_excel_file(input_path, keywords=exam_order or ExcelHandler.EXAM_KEYWORDS)
+        result['read_time'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        result['warnings'] = ExcelHandler.write_excel_file(sheets, result['output'], exam_order=exam_order,
+                                                           output_format=output_format)
+        result['write_time'] = time.perf_counter() - start
+        result['success'] = True
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def convert_all(files: List[str], output_dir: str, workers: int = None,
+                output_format: str = 'xls', exam_order: Optional[Sequence[str]] = None) -> List[Dict]:
+    """用进程池并行转换，按完成顺序逐个打印结果；输出文件名冲突时抛出 ValueError（见 output_paths）"""
+    outputs = output_paths(files, output_dir, output_format)
+    os.makedirs(output_dir, exist_ok=True)
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(convert_one, path, outputs[path], output_format, exam_order)
+                   for path in files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            name = os.path.relpath(result['output'], output_dir)
+            if result['success']:
+                print(f"✓ {name}  读取 {result['read_time']:.2f}s  写出 {result['write_time']:.2f}s")
+                for warning in result['warnings']:
+                    print(f"  ! {warning}")
+            else:
+                print(f"✗ {name}  {result['error']}")
+    return results
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='批量转换成绩 Excel 文件')
+    parser.add_argument('inputs', nargs='+', help='输入文件、目录或通配符（如 "data/*.xls"）')
+    parser.add_argument('-o', '--output-dir', default='downloads', help='输出目录（默认 downloads）')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='并行进程数（默认为 CPU 核数）')
+    parser.add_argument('--format', dest='output_format', choices=ExcelHandler.OUTPUT_FORMATS,
+                        default='xls', help='输出格式（默认 xls；超过 65536 行时用 xlsx）')
+    parser.add_argument('--exam-order', nargs='+', metavar='KEYWORD',
+                        help=f"考试顺序：工作表名称关键字，按先后顺序（默认 {' '.join(ExcelHandler.EXAM_KEYWORDS)}）")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.inputs)
+    if not files:
+        print("没有找到 .xls/.xlsx 文件")
+        return 1
+
+    print(f"共 {len(files)} 个文件，输出到 {os.path.abspath(args.output_dir)}")
+    start = time.perf_counter()
+    try:
+        results = convert_all(files, args.output_dir, args.workers, args.output_format, args.exam_order)
+    except ValueError as e:
+        print(e)
+        return 1
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if not result['success']]
+    print("=" * 60)
+    print(f"完成 {len(results) - len(failures)}/{len(results)} 个文件，总耗时 {elapsed:.2f}s")
+    if failures:
+        print("失败的文件:")
+        for result in sorted(failures, key=lambda item: item['input']):
+            print(f"  {result['input']}: {result['error']}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
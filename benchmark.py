@@ -0,0 +1,422 @@
+"""
+性能基准测试
+生成与 22高二期中.xls 结构相同的合成成绩表（默认 50、1000、10000、60000 人），
+分阶段记录 get_file_info、read_excel_file、parse_data、write_excel_file 及其中各 _write_* 阶段的耗时
+和进程内存峰值，结果写入 JSON 文件，便于对比不同版本
+
+用法:
+    python benchmark.py
+    python benchmark.py --students 1000 10000 --repeat 3 --json bench_new.json
+    python benchmark.py --compare bench_old.json             # 与之前的结果对比，变慢超过阈值时返回 1
+    python benchmark.py --implementations --students 1000    # 对比读取、写出的新旧实现
+"""
+import argparse
+import functools
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Callable, Dict, List, Optional
+
+import xlrd
+import xlwt
+
+from excel_handler import ExcelHandler, RankAverage, StudentIndex, XlsxWorkbook
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SUBJECTS = ['语文', '数学', '英语', '物理', '化学', '生物', '总分']
+FULL_MARKS = [150, 150, 150, 100, 100, 100]
+
+
+def _ranks(values: List[float]) -> List[int]:
+    """计算校次（分数越高名次越小，同分同名次）"""
+    order = sorted(values, reverse=True)
+    first = {}
+    for idx, value in enumerate(order):
+        first.setdefault(value, idx + 1)
+    return [first[value] for value in values]
+
+
+def _exam_rows(names: List[str], exam_name: str, rng: random.Random) -> List[List]:
+    """生成一次考试的学生数据行"""
+    scores = []
+    for _ in names:
+        row = [round(rng.uniform(full * 0.3, full) * 2) / 2 for full in FULL_MARKS]
+        row.append(sum(row))
+        scores.append(row)
+
+    ranks = [_ranks([row[i] for row in scores]) for i in range(len(SUBJECTS))]
+    rows = []
+    for student_idx, name in enumerate(names):
+        row = [exam_name, name]
+        for subject_idx in range(len(SUBJECTS)):
+            row.append(scores[student_idx][subject_idx])
+            row.append(float(ranks[subject_idx][student_idx]))
+        rows.append(row)
+    return rows
+
+
+def make_synthetic_workbook(file_path: str, n_students: int, seed: int = 0):
+    """
+    生成合成输入文件
+    结构与 22高二期中.xls 一致：
+    - 高二一调：表头 + 标签行 + 学生数据
+    - 高二期中：表头 + 学生数据 + 末尾标签行
+    """
+    rng = random.Random(seed)
+    names = [f'学生{idx:05d}' for idx in range(n_students)]
+    header = ['', '姓名']
+    for subject in SUBJECTS:
+        header += [subject, '校次']
+    labels = ['', ''] + ['得分', '校次'] * len(SUBJECTS)
+
+    workbook = xlwt.Workbook(encoding='utf-8')
+    layouts = [
+        ('高二一调', [header, labels] + _exam_rows(names, '高二一调', rng)),
+        ('高二期中', [header] + _exam_rows(names, '高二期中', rng) + [labels]),
+    ]
+    for sheet_name, rows in layouts:
+        ExcelHandler._emit_rows(workbook.add_sheet(sheet_name), ExcelHandler._prepare_rows(rows))
+    workbook.save(file_path)
+
+
+def _best_of(func: Callable, repeat: int) -> float:
+    """多次运行取最短耗时（秒）"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _legacy_read(sheet) -> List[List]:
+    """旧的读取方式：逐单元格调用 sheet.cell()"""
+    data = []
+    for row_idx in range(sheet.nrows):
+        row = []
+        for col_idx in range(sheet.ncols):
+            cell = sheet.cell(row_idx, col_idx)
+            if cell.ctype == xlrd.XL_CELL_NUMBER:
+                row.append(cell.value)
+            elif cell.ctype == xlrd.XL_CELL_EMPTY:
+                row.append('')
+            else:
+                row.append(str(cell.value))
+        data.append(row)
+    return data
+
+
+def bench_reader(file_path: str, repeat: int):
+    """对比逐单元格读取与按行批量读取"""
+    workbook = xlrd.open_workbook(file_path, formatting_info=False)
+    sheets = workbook.sheets()
+
+    for sheet in sheets:
+        if _legacy_read(sheet) != ExcelHandler._read_sheet_rows(sheet):
+            raise AssertionError(f"工作表 {sheet.name} 两种读取结果不一致")
+
+    cell_time = _best_of(lambda: [_legacy_read(s) for s in sheets], repeat)
+    row_time = _best_of(lambda: [ExcelHandler._read_sheet_rows(s) for s in sheets], repeat)
+    print(f"  读取 逐单元格: {cell_time * 1000:9.2f} ms")
+    print(f"  读取 按行批量: {row_time * 1000:9.2f} ms  (加速 {cell_time / row_time:.1f}x)")
+
+
+def _legacy_write(ws, rows: List[List], start_row: int = 0):
+    """旧的写出方式：逐单元格 isinstance 判断后调用 ws.write"""
+    for row_idx, row in enumerate(rows, start_row):
+        for col_idx, cell_value in enumerate(row):
+            if isinstance(cell_value, (int, float)):
+                ws.write(row_idx, col_idx, cell_value)
+            else:
+                ws.write(row_idx, col_idx, str(cell_value))
+
+
+def _write_legacy(sheet1, sheet2) -> xlwt.Workbook:
+    """旧写法：两张合并表 + 两张复制表，每张表都重新判断类型"""
+    workbook = xlwt.Workbook(encoding='utf-8')
+    for sheet_name in ('历次成绩原始', '历次成绩打印'):
+        ws = workbook.add_sheet(sheet_name)
+        _legacy_write(ws, sheet1.data[2:], 2)
+        _legacy_write(ws, sheet2.data[1:], len(sheet1.data))
+    for sheet in (sheet1, sheet2):
+        _legacy_write(workbook.add_sheet(sheet.name), sheet.data)
+    return workbook
+
+
+def _write_prepared(sheet1, sheet2) -> xlwt.Workbook:
+    """新写法：每行只预处理一次，四张表共用"""
+    workbook = xlwt.Workbook(encoding='utf-8')
+    rows1 = list(ExcelHandler._prepare_rows(sheet1.data))
+    rows2 = list(ExcelHandler._prepare_rows(sheet2.data))
+    for sheet_name in ('历次成绩原始', '历次成绩打印'):
+        ws = workbook.add_sheet(sheet_name)
+        next_row = ExcelHandler._emit_rows(ws, rows1[2:], 2)
+        ExcelHandler._emit_rows(ws, rows2[1:], next_row)
+    for sheet, rows in ((sheet1, rows1), (sheet2, rows2)):
+        ExcelHandler._emit_rows(workbook.add_sheet(sheet.name), rows)
+    return workbook
+
+
+def _saved_bytes(workbook: xlwt.Workbook) -> bytes:
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def bench_writer(file_path: str, repeat: int):
+    """对比逐单元格写出与预处理行写出（不含保存）"""
+    sheet1, sheet2 = ExcelHandler.read_excel_file(file_path)
+    if _saved_bytes(_write_legacy(sheet1, sheet2)) != _saved_bytes(_write_prepared(sheet1, sheet2)):
+        raise AssertionError("两种写出结果不一致")
+
+    legacy_time = _best_of(lambda: _write_legacy(sheet1, sheet2), repeat)
+    prepared_time = _best_of(lambda: _write_prepared(sheet1, sheet2), repeat)
+    print(f"  写出 逐单元格: {legacy_time * 1000:9.2f} ms")
+    print(f"  写出 预处理行: {prepared_time * 1000:9.2f} ms  (加速 {legacy_time / prepared_time:.1f}x)")
+
+
+# 对比时耗时低于此值（秒）的阶段只打印、不判定是否变慢（误差大于差异）
+MIN_COMPARE_SECONDS = 0.005
+
+# xls 工作表的行数上限，合并表超过时改用 xlsx 输出
+XLS_MAX_ROWS = 65536
+
+# write_excel_file 内部分别计时的阶段：(所属类, 方法名)；
+# 计时包含方法内部的调用（如 _write_single_sheet 内的 _write_rows_sheet）；
+# _prepare_rows、_merge_rows 是生成器，耗时计入实际取用它们的写出阶段
+WRITE_STAGES = [
+    (ExcelHandler, '_write_rows_sheet'),
+    (ExcelHandler, 'select_top_students'),
+    (ExcelHandler, '_write_top_students_sheet'),
+    (ExcelHandler, '_write_empty_sheet'),
+    (ExcelHandler, '_write_single_sheet'),
+    (ExcelHandler, '_write_average_sheet'),
+    (StudentIndex, '__init__'),
+    (RankAverage, '__init__'),
+    (xlwt.Workbook, 'save'),
+    (XlsxWorkbook, 'save'),
+]
+
+
+def peak_rss_mb() -> Optional[float]:
+    """进程的内存峰值（MB），不支持的平台返回 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位为 KB，macOS 为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageTimer:
+    """按阶段累计耗时和调用次数，记录阶段结束时的内存峰值"""
+
+    def __init__(self):
+        self.stages: Dict[str, Dict] = {}
+
+    def record(self, name: str, seconds: float):
+        stage = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+        stage['seconds'] += seconds
+        stage['calls'] += 1
+        stage['peak_rss_mb'] = peak_rss_mb()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def _wrap(self, name: str, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.stage(name):
+                return func(*args, **kwargs)
+        return timed
+
+    @contextmanager
+    def instrument(self, targets=WRITE_STAGES):
+        """临时替换 targets 中的方法为计时版本，退出时恢复"""
+        originals = []
+        try:
+            for owner, attr in targets:
+                original = owner.__dict__[attr]
+                name = owner.__name__ if attr == '__init__' else f'{owner.__name__}.{attr}'
+                if isinstance(original, staticmethod):
+                    patched = staticmethod(self._wrap(name, original.__func__))
+                else:
+                    patched = self._wrap(name, original)
+                originals.append((owner, attr, original))
+                setattr(owner, attr, patched)
+            yield self
+        finally:
+            for owner, attr, original in reversed(originals):
+                setattr(owner, attr, original)
+
+
+def _best(runs: List[Dict[str, Dict]]) -> Dict[str, Dict]:
+    """多次运行中每个阶段取最短耗时，内存峰值取最后一次"""
+    best = {}
+    for stages in runs:
+        for name, stage in stages.items():
+            if name not in best or stage['seconds'] < best[name]['seconds']:
+                best[name] = dict(stage)
+    return best
+
+
+def bench_stages(file_path: str, n_students: int, repeat: int, output_format: str) -> Dict:
+    """一个规模的完整流程：信息汇总、读取、解析、写出（写出内部分阶段计时）"""
+    output_path = os.path.splitext(file_path)[0] + f'_out.{output_format}'
+    runs = []
+    for _ in range(repeat):
+        timer = StageTimer()
+        # 清空工作簿缓存，每次都从文件解码
+        ExcelHandler.workbook_cache.clear()
+        with timer.stage('get_file_info'):
+            info = ExcelHandler.get_file_info(file_path)
+        if not info.get('success'):
+            raise RuntimeError(info.get('error'))
+
+        ExcelHandler.workbook_cache.clear()
+        with timer.stage('read_excel_file'):
+            sheets = ExcelHandler.read_excel_file(file_path)
+        with timer.stage('parse_data'):
+            for sheet in sheets:
+                sheet.parse_data()
+        with timer.instrument(), timer.stage('write_excel_file'):
+            ExcelHandler.write_excel_file(sheets, output_path, output_format=output_format)
+        runs.append(timer.stages)
+
+    return {
+        'students': n_students,
+        'output_format': output_format,
+        'input_bytes': os.path.getsize(file_path),
+        'output_bytes': os.path.getsize(output_path),
+        'stages': _best(runs),
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def run_size(n_students: int, repeat: int, output_format: str, tmp_dir: str) -> Dict:
+    """在子进程中运行一个规模（各规模的内存峰值互不影响）"""
+    file_path = os.path.join(tmp_dir, f'synthetic_{n_students}.xls')
+    make_synthetic_workbook(file_path, n_students)
+    # 两次考试合并后超过 xls 行数上限时改用 xlsx
+    merged_rows = 2 * n_students + 2
+    if output_format == 'xls' and merged_rows > XLS_MAX_ROWS:
+        output_format = 'xlsx'
+    return bench_stages(file_path, n_students, repeat, output_format)
+
+
+def environment() -> Dict:
+    """运行环境和依赖版本，便于对比不同版本的结果"""
+    versions = {}
+    for package in ('xlrd', 'xlwt', 'openpyxl', 'numpy'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ''
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit or None,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'packages': versions,
+    }
+
+
+def print_result(result: Dict):
+    print(f"学生数 {result['students']}（输出 {result['output_format']}）:")
+    for name, stage in result['stages'].items():
+        calls = f" x{stage['calls']}" if stage['calls'] > 1 else ''
+        peak = f"  峰值 {stage['peak_rss_mb']:.0f} MB" if stage.get('peak_rss_mb') is not None else ''
+        print(f"  {name:<40} {stage['seconds'] * 1000:11.2f} ms{calls}{peak}")
+
+
+def compare(results: List[Dict], baseline_path: str, threshold: float) -> bool:
+    """与之前的结果对比，打印各阶段耗时比；有阶段变慢超过 threshold 倍时返回 False"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = {(item['students'], item['output_format']): item for item in json.load(f)['results']}
+    ok = True
+    print(f"与 {baseline_path} 对比（>{threshold:.2f}x 视为变慢）:")
+    for result in results:
+        old = baseline.get((result['students'], result['output_format']))
+        if old is None:
+            continue
+        print(f"学生数 {result['students']}:")
+        for name, stage in result['stages'].items():
+            old_stage = old['stages'].get(name)
+            if old_stage is None or not old_stage['seconds']:
+                continue
+            ratio = stage['seconds'] / old_stage['seconds']
+            slower = ratio > threshold and max(stage['seconds'], old_stage['seconds']) >= MIN_COMPARE_SECONDS
+            flag = '  变慢' if slower else ''
+            ok = ok and not slower
+            print(f"  {name:<40} {old_stage['seconds'] * 1000:11.2f} -> {stage['seconds'] * 1000:11.2f} ms"
+                  f"  {ratio:5.2f}x{flag}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description='成绩表处理性能基准')
+    parser.add_argument('--students', type=int, nargs='+', default=[50, 1000, 10000, 60000],
+                        help='每次考试的学生人数')
+    parser.add_argument('--repeat', type=int, default=1, help='每项重复次数（取最短耗时）')
+    parser.add_argument('--format', dest='output_format', choices=ExcelHandler.OUTPUT_FORMATS, default='xls',
+                        help='输出格式（默认 xls；合并表超过 65536 行的规模自动改用 xlsx）')
+    parser.add_argument('--json', default='benchmark_results.json', help='结果文件（默认 benchmark_results.json）')
+    parser.add_argument('--compare', metavar='BASELINE', help='与之前保存的结果文件对比')
+    parser.add_argument('--threshold', type=float, default=1.2, help='对比时视为变慢的耗时比（默认 1.2）')
+    parser.add_argument('--implementations', action='store_true',
+                        help='只对比读取、写出的新旧实现（逐单元格 / 按行批量）')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.implementations:
+            for n_students in args.students:
+                file_path = os.path.join(tmp_dir, f'synthetic_{n_students}.xls')
+                make_synthetic_workbook(file_path, n_students)
+                print(f"学生数 {n_students}:")
+                bench_reader(file_path, args.repeat)
+                bench_writer(file_path, args.repeat)
+            return 0
+
+        results = []
+        for n_students in args.students:
+            # 每个规模一个新进程，内存峰值只反映该规模
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                result = executor.submit(run_size, n_students, args.repeat, args.output_format, tmp_dir).result()
+            print_result(result)
+            results.append(result)
+
+    with open(args.json, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment(), 'repeat': args.repeat, 'results': results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {os.path.abspath(args.json)}")
+
+    if args.compare and not compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
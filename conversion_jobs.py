@@ -0,0 +1,362 @@
+"""
+成绩导入转换工具 - 异步转换任务
+提交后立即返回任务 ID，由固定大小的线程池执行转换，前端轮询任务状态
+"""
+import io
+import multiprocessing
+import os
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from excel_handler import ExcelHandler, ParsedWorkbook
+from result_cache import ResultCache
+
+# 任务状态
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class UploadStore:
+    """
+    内存模式下保存上传的工作簿（不落盘）
+
+    保存的是 ParsedWorkbook，上传时预览解码的工作表在转换时直接复用；
+    按上传内容的总字节数做 LRU 淘汰
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[str, ParsedWorkbook]]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def put(self, filename: str, workbook: ParsedWorkbook) -> str:
+        """保存上传的工作簿，返回上传 ID"""
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[upload_id] = (filename, workbook)
+            self._size += len(workbook.file_contents)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._size -= len(evicted.file_contents)
+        return upload_id
+
+    def get(self, upload_id: str) -> Optional[Tuple[str, ParsedWorkbook]]:
+        """获取 (文件名, 工作簿)，不存在（或已淘汰）时返回 None"""
+        with self._lock:
+            entry = self._entries.get(upload_id)
+            if entry is not None:
+                self._entries.move_to_end(upload_id)
+            return entry
+
+    def discard(self, upload_id: str):
+        """删除一个上传的工作簿"""
+        with self._lock:
+            entry = self._entries.pop(upload_id, None)
+            if entry is not None:
+                self._size -= len(entry[1].file_contents)
+
+
+class JobManager:
+    """
+    转换任务管理
+
+    - 线程池大小固定（max_workers），超出的任务排队等待，不会占满请求线程
+    - 任务记录保存在内存中，已结束的任务最多保留 max_finished 个
+    - 内存模式的转换结果保存在任务记录中，总大小超过 max_result_bytes 时
+      最早的结果被丢弃
+    - 指定 cache 时，相同内容和选项的文件直接返回缓存的结果，不再转换
+    - processes 大于 0 时转换在进程池中执行，不受 GIL 限制，可同时进行 processes 个转换；
+      子进程异常退出（如内存不足被杀）导致进程池损坏时，当前任务失败，进程池重新创建
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 200,
+                 max_result_bytes: int = 256 * 1024 * 1024, cache: Optional[ResultCache] = None,
+                 processes: int = 0):
+        self.processes = processes
+        self.process_pool = None
+        self.pool_restarts = 0
+        # 任务发现进程池损坏（BrokenProcessPool）时置位，进程池重新创建后清除
+        self._pool_broken = False
+        self._pool_lock = threading.Lock()
+        if processes > 0:
+            self.process_pool = self._new_process_pool()
+            max_workers = processes
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='convert')
+        self.max_workers = max_workers
+        self._shutdown = False
+        self.cache = cache
+        self.max_finished = max_finished
+        self.max_result_bytes = max_result_bytes
+        self._jobs: 'OrderedDict[str, Dict]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, source: Union[str, ParsedWorkbook], output_filepath: Optional[str] = None,
+               output_filename: Optional[str] = None, options: Optional[Dict] = None) -> str:
+        """
+        提交转换任务，返回任务 ID
+
+        source 为输入文件路径，或内存中的工作簿（ExcelHandler.load_contents）；
+        output_filepath 为空时结果写入内存（任务记录的 result），用 output_filename 作为下载名；
+        options 为 write_excel_file 的转换选项。
+        命中结果缓存时任务直接以完成状态返回
+        """
+        options = dict(options or {})
+        job_id = uuid.uuid4().hex
+        job = {
+            'job_id': job_id,
+            'status': JOB_QUEUED,
+            'progress': 0,
+            'message': '排队中...',
+            'output_filename': output_filename or os.path.basename(output_filepath),
+            'output_filepath': output_filepath,
+            'in_memory': output_filepath is None,
+            # 任务使用的磁盘文件，结束前不能被清理
+            'paths': self._job_paths(source, output_filepath),
+            'cached': False,
+            'result': None,
+            'error': '',
+            # 转换时的警告信息（如同一次考试中重复出现的学生）
+            'warnings': [],
+            'created': time.time(),
+            'finished': None,
+        }
+        
+        cache_key = None
+        if self.cache is not None:
+            cache_key = ResultCache.make_key(self._cache_source(source), options)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                try:
+                    self._finish_from_cache(job, cached, output_filepath)
+                except OSError:
+                    pass  # 缓存文件刚好被淘汰，按未命中处理
+        
+        with self._lock:
+            self._jobs[job_id] = job
+            self._prune()
+        if job['status'] != JOB_DONE:
+            self.executor.submit(self._run, job_id, source, output_filepath, options, cache_key)
+        return job_id
+
+    def _new_process_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=_process_context())
+
+    def _restart_process_pool(self, broken: ProcessPoolExecutor):
+        """替换已损坏的进程池（多个任务同时发现时只替换一次）"""
+        with self._pool_lock:
+            if self._shutdown:
+                return
+            if self.process_pool is not broken:
+                # 其他任务已经替换过
+                self._pool_broken = False
+                return
+            broken.shutdown(wait=False)
+            self.process_pool = self._new_process_pool()
+            self.pool_restarts += 1
+            self._pool_broken = False
+        print(f"转换进程池已损坏，已重新创建（第 {self.pool_restarts} 次）")
+
+    @property
+    def uses_processes(self) -> bool:
+        """转换是否在子进程中执行（父进程解码的工作表不会被转换复用）"""
+        return self.process_pool is not None
+
+    @property
+    def pool_healthy(self) -> bool:
+        """进程池是否可用：不使用进程池，或没有损坏（损坏后重新创建失败时为 False）"""
+        return self.process_pool is None or not self._pool_broken
+
+    @staticmethod
+    def _job_paths(source: Union[str, ParsedWorkbook], output_filepath: Optional[str]) -> Tuple[str, ...]:
+        paths = []
+        if isinstance(source, str):
+            paths.append(os.path.abspath(source))
+        elif source.file_contents is None:
+            paths.append(os.path.abspath(source.file_path))
+        if output_filepath is not None:
+            paths.append(os.path.abspath(output_filepath))
+        return tuple(paths)
+
+    def in_use(self, path: str) -> bool:
+        """文件（绝对路径）是否正被排队或进行中的任务使用"""
+        with self._lock:
+            return any(path in job['paths'] for job in self._jobs.values()
+                       if job['status'] in (JOB_QUEUED, JOB_RUNNING))
+
+    @staticmethod
+    def _cache_source(source: Union[str, ParsedWorkbook]) -> Union[str, bytes]:
+        """用于计算缓存键的文件内容（或路径）"""
+        if isinstance(source, ParsedWorkbook):
+            return source.file_contents if source.file_contents is not None else source.file_path
+        return source
+
+    @staticmethod
+    def _finish_from_cache(job: Dict, cached: Tuple[Union[str, bytes], List[str]], output_filepath: Optional[str]):
+        """用缓存的结果（缓存文件路径，或内存缓存中的文件内容）和警告信息完成任务"""
+        cached, warnings = cached
+        if isinstance(cached, bytes):
+            if output_filepath is None:
+                job['result'] = cached
+            else:
+                os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
+                with open(output_filepath, 'wb') as f:
+                    f.write(cached)
+        elif output_filepath is None:
+            with open(cached, 'rb') as f:
+                job['result'] = f.read()
+        else:
+            os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
+            shutil.copyfile(cached, output_filepath)
+        job.update(status=JOB_DONE, progress=100, message='转换成功！（使用缓存结果）',
+                   cached=True, warnings=warnings, finished=time.time())
+
+    @property
+    def accepting(self) -> bool:
+        """是否可以接受新任务"""
+        return not self._shutdown
+
+    def stats(self) -> Dict:
+        """各状态的任务数"""
+        with self._lock:
+            counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)}
+            for job in self._jobs.values():
+                counts[job['status']] += 1
+        counts['workers'] = self.max_workers
+        if self.process_pool is not None:
+            counts['pool_restarts'] = self.pool_restarts
+        return counts
+
+    def shutdown(self, wait: bool = True):
+        """停止接受新任务，等待进行中的任务完成"""
+        self._shutdown = True
+        self.executor.shutdown(wait=wait)
+        with self._pool_lock:
+            if self.process_pool is not None:
+                self.process_pool.shutdown(wait=wait)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """获取任务状态（副本），任务不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def _update(self, job_id: str, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+            if 'result' in fields:
+                self._prune()
+
+    def _prune(self):
+        """已结束的任务超过上限时，删除最早的记录；内存中的结果超过上限时丢弃最早的结果"""
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished'] is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+        results = [job for job in self._jobs.values() if job['result'] is not None]
+        total = sum(len(job['result']) for job in results)
+        for job in results[:-1]:
+            if total <= self.max_result_bytes:
+                break
+            total -= len(job['result'])
+            job['result'] = None
+
+    def _run(self, job_id: str, source: Union[str, ParsedWorkbook], output_filepath: Optional[str],
+             options: Dict, cache_key: Optional[str]):
+        """在工作线程中执行转换（使用进程池时，工作线程等待子进程完成）"""
+        try:
+            self._update(job_id, status=JOB_RUNNING, progress=10, message='正在读取文件...')
+            pool = self.process_pool
+            if pool is not None:
+                self._update(job_id, progress=30, message='正在转换...')
+                try:
+                    future = pool.submit(convert_in_process, self._cache_source(source), output_filepath, options)
+                    result, warnings = future.result()
+                except BrokenProcessPool:
+                    self._pool_broken = True
+                    self._restart_process_pool(pool)
+                    raise RuntimeError('转换进程异常退出（可能是文件过大导致内存不足），请稍后重试')
+            else:
+                keywords = exam_keywords(options)
+                if isinstance(source, ParsedWorkbook):
+                    sheets = source.load(keywords)
+                else:
+                    sheets = ExcelHandler.read_excel_file(source, keywords=keywords)
+                self._update(job_id, progress=50, message='正在生成输出文件...')
+                result, warnings = write_result(sheets, output_filepath, options)
+
+            if output_filepath is None:
+                self._store(cache_key, result, options, warnings)
+                self._update(job_id, status=JOB_DONE, progress=100, message='转换成功！',
+                             result=result, warnings=warnings, finished=time.time())
+                return
+
+            if not os.path.exists(output_filepath):
+                raise RuntimeError('文件生成失败')
+            print(f"文件已生成: {output_filepath} ({os.path.getsize(output_filepath)} bytes)")
+            self._store(cache_key, output_filepath, options, warnings)
+            self._update(job_id, status=JOB_DONE, progress=100, message='转换成功！',
+                         warnings=warnings, finished=time.time())
+        except ValueError as e:
+            self._update(job_id, status=JOB_FAILED, error=str(e), finished=time.time())
+        except Exception as e:
+            print(f"转换错误: {e}")
+            traceback.print_exc()
+            self._update(job_id, status=JOB_FAILED, error=f'转换失败: {str(e)}', finished=time.time())
+
+    def _store(self, cache_key: Optional[str], result: Union[str, bytes], options: Dict, warnings: List[str]):
+        """把转换结果存入缓存；缓存失败不影响任务本身"""
+        if cache_key is None:
+            return
+        try:
+            self.cache.put(cache_key, result, options.get('output_format', 'xls'), warnings)
+        except OSError as e:
+            print(f"缓存转换结果失败: {e}")
+
+
+def exam_keywords(options: Dict) -> Sequence[str]:
+    """转换要读取的工作表（名称关键字）：选项中的考试顺序，默认 EXAM_KEYWORDS"""
+    return options.get('exam_order') or ExcelHandler.EXAM_KEYWORDS
+
+
+def write_result(sheets, output_filepath: Optional[str], options: Dict) -> Tuple[Optional[bytes], List[str]]:
+    """写出转换结果，返回 (文件内容, 警告信息)：output_filepath 为空时写入内存并返回文件内容，否则为 None"""
+    if output_filepath is None:
+        buffer = io.BytesIO()
+        warnings = ExcelHandler.write_excel_file(sheets, buffer, **options)
+        return buffer.getvalue(), warnings
+    os.makedirs(os.path.dirname(output_filepath) or '.', exist_ok=True)
+    return None, ExcelHandler.write_excel_file(sheets, output_filepath, **options)
+
+
+def convert_in_process(source: Union[str, bytes], output_filepath: Optional[str],
+                       options: Dict) -> Tuple[Optional[bytes], List[str]]:
+    """在子进程中执行转换，source 为文件路径或文件内容"""
+    keywords = exam_keywords(options)
+    if isinstance(source, (bytes, bytearray)):
+        sheets = ExcelHandler.read_excel_file('', keywords=keywords, file_contents=source)
+    else:
+        sheets = ExcelHandler.read_excel_file(source, keywords=keywords)
+    return write_result(sheets, output_filepath, options)
+
+
+def _process_context():
+    """
+    子进程的启动方式
+    支持 forkserver 时（Linux）由预先导入了 excel_handler（xlrd/xlwt/numpy）的服务进程 fork，
+    避免每个子进程重新导入，也避免从多线程的 Web 进程直接 fork
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['excel_handler'])
+        return context
+    return multiprocessing.get_context('spawn')
@@ -18,342 +18,1265 @@ Excel 数据处理模块
   7. 均值 姓名排序（计算）
   8. 两次 均值 升序（计算）
 """
+import heapq
+import io
+import mmap
+import os
+import sys
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from itertools import chain, islice
+from typing import Callable, List, Dict, Iterable, Iterator, Tuple, Optional
+
+import numpy as np
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 import xlrd
 import xlwt
-from typing import List, Dict, Tuple, Optional
+from xlwt.Cell import BlankCell, NumberCell, StrCell
+
+NAN = float('nan')
+
+# 写出时的单元格类型（见 ExcelHandler._prepare_rows）
+CELL_NUMBER = 0
+CELL_TEXT = 1
+CELL_BLANK = 2
+
+
+# 默认列布局中的科目顺序：列3-16 依次为各科（得分, 校次）
+SUBJECTS = ['语文', '数学', '英语', '物理', '化学', '生物', '总分']
+
+# 缺失或非数值的校次按此值排在最后
+MISSING_RANK = 9999
+
+
+class SheetSchema:
+    """
+    工作表的列布局：姓名列、考试名称列和各科的 (得分列, 校次列)
+
+    由表头行（含"姓名"的行）和其后的标签行识别，科目取表头中的名称，
+    不限于 SUBJECTS（如政治、历史、地理）；科目右侧一列的表头（或标签）为空或为"校次"时
+    作为该科的校次列。找不到"姓名"时按默认布局（SUBJECTS 依次排列）处理。
+    表头相同的工作表共用一个识别结果（见 detect）
+    """
+
+    NAME_HEADERS = ('姓名',)
+    EXAM_HEADERS = ('考试', '考试名称')
+    RANK_HEADERS = ('校次', '排名', '名次')
+    LABEL_HEADERS = ('得分', '成绩', '分数')
+    # 不是科目的表头（班级、学号由 StudentIndex 识别）
+    OTHER_HEADERS = ('班级', '学号', '考号', '序号')
+    # 只在前几行中查找表头
+    MAX_HEADER_ROWS = 5
+    CACHE_SIZE = 64
+
+    _cache: 'OrderedDict[Tuple, SheetSchema]' = OrderedDict()
+    _cache_lock = threading.Lock()
+
+    def __init__(self, name_col: int, exam_col: Optional[int],
+                 columns: Dict[str, Tuple[int, Optional[int]]], data_start: int = 1):
+        """columns: {科目: (得分列, 校次列)}，按列号顺序；没有校次列时为 None"""
+        self.name_col = name_col
+        self.exam_col = exam_col
+        self.columns = dict(columns)
+        self.subjects = list(self.columns)
+        self.data_start = data_start
+
+    @classmethod
+    def default(cls, data_start: int = 1) -> 'SheetSchema':
+        """默认布局：考试名称、姓名，之后 SUBJECTS 各占（得分, 校次）两列"""
+        columns = {subject: (2 + idx * 2, 3 + idx * 2) for idx, subject in enumerate(SUBJECTS)}
+        return cls(1, 0, columns, data_start)
+
+    @property
+    def layout(self) -> Tuple:
+        """用于比较两张表的列是否一致（合并时要求各次考试一致）"""
+        return (self.name_col, tuple((subject, cols[0]) for subject, cols in self.columns.items()))
+
+    @property
+    def width(self) -> int:
+        return max([self.name_col] + [col for cols in self.columns.values()
+                                      for col in cols if col is not None]) + 1
+
+    def rank_col(self, subject: str, sheet_name: str = '') -> int:
+        """某科的校次列，没有该科或没有校次列时抛出 ValueError"""
+        cols = self.columns.get(subject)
+        if cols is None or cols[1] is None:
+            raise ValueError(f"工作表{sheet_name}中没有「{subject}」的校次列")
+        return cols[1]
+
+    @classmethod
+    def locate(cls, rows: Sequence[List]) -> Optional[Tuple[int, int]]:
+        """在前 MAX_HEADER_ROWS 行中查找"姓名"，返回 (表头行号, 姓名列号)"""
+        for row_idx, row in enumerate(rows[:cls.MAX_HEADER_ROWS]):
+            for col_idx, value in enumerate(row):
+                if isinstance(value, str) and StudentIndex.normalize(value) in cls.NAME_HEADERS:
+                    return row_idx, col_idx
+        return None
+
+    @classmethod
+    def detect(cls, data: List[List]) -> 'SheetSchema':
+        """识别工作表的列布局；表头行和标签行完全相同的工作表直接使用缓存的结果"""
+        located = cls.locate(data)
+        header_idx, name_col = located if located is not None else (0, 1)
+        # 表头之后第一个有姓名的行为数据起始行，中间的行视为标签行
+        data_start = len(data)
+        for row_idx in range(header_idx + 1, len(data)):
+            row = data[row_idx]
+            if len(row) > name_col and row[name_col]:
+                data_start = row_idx
+                break
+
+        key = (located is not None, name_col, tuple(tuple(row) for row in data[:data_start]))
+        with cls._cache_lock:
+            schema = cls._cache.get(key)
+            if schema is not None:
+                cls._cache.move_to_end(key)
+                return schema
+
+        if located is None:
+            schema = cls.default(data_start)
+        else:
+            schema = cls._build(data[header_idx:data_start], name_col, data_start)
+        with cls._cache_lock:
+            cls._cache[key] = schema
+            while len(cls._cache) > cls.CACHE_SIZE:
+                cls._cache.popitem(last=False)
+        return schema
+
+    @classmethod
+    def _header_text(cls, value) -> str:
+        """
+        规范化表头文字
+        pandas 导出的表头：空表头写为 "Unnamed: 0"，重复的表头加 ".1"、".2" 等后缀，这里还原
+        """
+        text = StudentIndex.normalize(value)
+        if text.startswith('Unnamed:'):
+            return ''
+        base, dot, suffix = text.rpartition('.')
+        if dot and suffix.isdigit() and base in cls.RANK_HEADERS + cls.LABEL_HEADERS:
+            return base
+        return text
+
+    @classmethod
+    def _build(cls, header_rows: List[List], name_col: int, data_start: int) -> 'SheetSchema':
+        """按表头行（header_rows[0]）和标签行建立列映射"""
+        rows = [[cls._header_text(value) for value in row] for row in header_rows]
+        width = max(len(row) for row in rows)
+        header = rows[0] + [''] * (width - len(rows[0]))
+
+        def label(col_idx: int) -> str:
+            """表头为空时取标签行中的文字"""
+            if header[col_idx]:
+                return header[col_idx]
+            return next((row[col_idx] for row in rows[1:] if col_idx < len(row) and row[col_idx]), '')
+
+        exam_col = next((idx for idx, text in enumerate(header) if text in cls.EXAM_HEADERS), None)
+        if exam_col is None and name_col > 0 and not header[0]:
+            exam_col = 0
+        skip = cls.NAME_HEADERS + cls.EXAM_HEADERS + cls.RANK_HEADERS + cls.LABEL_HEADERS + cls.OTHER_HEADERS
+
+        columns = {}
+        col_idx = 0
+        while col_idx < width:
+            text = header[col_idx]
+            if col_idx == name_col or not text or text in skip or text in columns:
+                col_idx += 1
+                continue
+            rank_col = None
+            if col_idx + 1 < width and col_idx + 1 != name_col and label(col_idx + 1) in cls.RANK_HEADERS + ('',):
+                rank_col = col_idx + 1
+            columns[text] = (col_idx, rank_col)
+            col_idx += 2 if rank_col is not None else 1
+        return cls(name_col, exam_col, columns, data_start)
+
+    def template_rows(self) -> List[List]:
+        """按此布局生成只有表头和标签行的空表（考试名称列作为班级列，同原模板）"""
+        headers = [''] * self.width
+        labels = [''] * self.width
+        headers[self.name_col] = '姓名'
+        if self.exam_col is not None:
+            headers[self.exam_col] = '班级'
+        for subject, (score_col, rank_col) in self.columns.items():
+            headers[score_col] = subject
+            labels[score_col] = '得分'
+            if rank_col is not None:
+                labels[rank_col] = '校次'
+                if subject == '总分':
+                    headers[rank_col] = '校次'
+        return [headers, labels]
+
+
+class ScoreColumns:
+    """
+    列式成绩存储
+    每科一个得分数组、一个校次数组（array('d')），姓名列使用驻留字符串，
+    避免为每个学生创建多层嵌套字典
+    """
+
+    def __init__(self, schema: Optional[SheetSchema] = None):
+        self.schema = schema if schema is not None else SheetSchema.default()
+        self.subjects = self.schema.subjects
+        self._cols = list(self.schema.columns.values())
+        self.exam_names: List[str] = []
+        self.names: List[str] = []
+        # 每个学生在工作表数据中的行号
+        self.rows = array('q')
+        self.scores: Dict[str, array] = {subject: array('d') for subject in self.subjects}
+        self.ranks: Dict[str, array] = {subject: array('d') for subject in self.subjects}
+        # 每个学生实际包含的科目数（行长度不足时后面的科目缺失）
+        self.widths = array('B')
+        # 非数值单元格（如"缺考"）：(学生序号, 科目序号, 是否为校次) -> 原值
+        self.extras: Dict[Tuple[int, int, bool], object] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _encode(self, student_idx: int, subject_idx: int, is_rank: bool, value) -> float:
+        """数值直接存入数组，空值记为 NaN，其他值另存到 extras"""
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        if value != '' and value is not None:
+            self.extras[(student_idx, subject_idx, is_rank)] = value
+        return NAN
+
+    def _decode(self, student_idx: int, subject_idx: int, is_rank: bool, value: float):
+        if value == value:  # 非 NaN
+            return value
+        return self.extras.get((student_idx, subject_idx, is_rank))
+
+    def append_row(self, row: List, row_idx: int = -1):
+        """追加一行学生数据（按 schema 的列映射取值），row_idx 为该行在工作表中的行号"""
+        student_idx = len(self.names)
+        self.rows.append(row_idx)
+        exam_col = self.schema.exam_col
+        exam_name = row[exam_col] if exam_col is not None and exam_col < len(row) else ''
+        self.exam_names.append(sys.intern(str(exam_name).strip()) if exam_name else '')
+        self.names.append(sys.intern(str(row[self.schema.name_col]).strip()))
+
+        # 行长度不足时，得分列超出行尾的科目记为缺失
+        width = 0
+        for subject_idx, (score_col, rank_col) in enumerate(self._cols):
+            subject = self.subjects[subject_idx]
+            if score_col < len(row):
+                width = subject_idx + 1
+                score = row[score_col]
+            else:
+                score = ''
+            rank = row[rank_col] if rank_col is not None and rank_col < len(row) else ''
+            self.scores[subject].append(self._encode(student_idx, subject_idx, False, score))
+            self.ranks[subject].append(self._encode(student_idx, subject_idx, True, rank))
+        self.widths.append(width)
+
+    def value(self, subject: str, idx: int, is_rank: bool = False):
+        """单个学生某科的得分或校次（原值，空值为 None）"""
+        subject_idx = self.subjects.index(subject)
+        if subject_idx >= self.widths[idx]:
+            return None
+        store = self.ranks if is_rank else self.scores
+        return self._decode(idx, subject_idx, is_rank, store[subject][idx])
+
+    def student(self, idx: int) -> Dict:
+        """按原 parse_data 的字典结构还原单个学生"""
+        scores = {}
+        for subject_idx in range(self.widths[idx]):
+            subject = self.subjects[subject_idx]
+            scores[subject] = {
+                'score': self._decode(idx, subject_idx, False, self.scores[subject][idx]),
+                'rank': self._decode(idx, subject_idx, True, self.ranks[subject][idx])
+            }
+        return {
+            'exam_name': self.exam_names[idx],
+            'name': self.names[idx],
+            'scores': scores
+        }
+
+
+class StudentList(Sequence):
+    """ExamSheet.students 的只读视图，按需从列式存储生成学生字典"""
+
+    def __init__(self, columns: ScoreColumns):
+        self._columns = columns
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._columns.student(i) for i in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('student index out of range')
+        return self._columns.student(idx)
 
 
 class ExamSheet:
     """考试成绩工作表数据"""
     
-    def __init__(self, name: str, data: List[List]):
+    def __init__(self, name: str, data: List[List], parse_students: bool = True):
         self.name = name
         self.data = data  # 保持原始数据结构
-        self.students = []
+        # parse_students=False 时不解析学生（只复制工作表的流程用不到），访问 columns 会报错
+        self.parse_students = parse_students
+        self._columns: Optional[ScoreColumns] = None
+        self._schema: Optional[SheetSchema] = None
+    
+    @property
+    def schema(self) -> SheetSchema:
+        """列布局（由表头识别，见 SheetSchema.detect）"""
+        if self._schema is None:
+            self._schema = SheetSchema.detect(self.data)
+        return self._schema
+    
+    @property
+    def columns(self) -> ScoreColumns:
+        """列式成绩存储，首次访问时才解析"""
+        if self._columns is None:
+            if not self.parse_students:
+                raise ValueError(f"工作表「{self.name}」读取时未解析学生（parse_students=False），没有成绩数据")
+            self.parse_data()
+        return self._columns
+    
+    @property
+    def data_start(self) -> int:
+        """第一行学生数据的行号（表头之后第一个有姓名的行），标签行视为表头"""
+        return self.schema.data_start
+    
+    @property
+    def students(self) -> StudentList:
+        """学生列表（字典结构与旧版一致，由列式存储按需生成）"""
+        return StudentList(self.columns)
         
     def parse_data(self):
-        """解析学生数据"""
-        self.students = []
-        # 数据从第2行(索引1)开始
-        for row_idx in range(1, len(self.data)):
+        """按识别出的列布局解析学生数据到列式存储"""
+        schema = self.schema
+        columns = ScoreColumns(schema)
+        name_col = schema.name_col
+        for row_idx in range(schema.data_start, len(self.data)):
             row = self.data[row_idx]
-            if len(row) >= 2 and row[1]:  # 确保有姓名
-                student_data = {
-                    'exam_name': str(row[0]).strip() if row[0] else '',
-                    'name': str(row[1]).strip(),
-                    'scores': {}
-                }
-                
-                # 解析各科成绩和排名
-                # 列3-16：语文(3,4), 数学(5,6), 英语(7,8), 物理(9,10), 化学(11,12), 生物(13,14), 总分(15,16)
-                subjects = ['语文', '数学', '英语', '物理', '化学', '生物', '总分']
-                col_idx = 2
-                
-                for subject in subjects:
-                    if col_idx < len(row):
-                        score = row[col_idx]
-                        rank = row[col_idx + 1] if col_idx + 1 < len(row) else None
-                        
-                        student_data['scores'][subject] = {
-                            'score': score if score != '' else None,
-                            'rank': rank if rank != '' else None
-                        }
-                        col_idx += 2
-                
-                self.students.append(student_data)
+            if len(row) > name_col and row[name_col]:  # 确保有姓名
+                columns.append_row(row, row_idx)
+        self._columns = columns
+
+
+class StudentIndex:
+    """
+    跨考试的学生索引
+    
+    以规范化后的 (班级, 姓名) 为键；各次考试都有学号列时改用学号。
+    同一次考试中重复出现的键按出现次序区分（第 k 个"张三"对应其他考试中的第 k 个），
+    不再互相覆盖，并记录在 duplicates 中（转换时作为警告报告，见 duplicate_messages）。
+    有班级列时 classes 为各学生的班级（取首次出现时的值），均值表据此多写一列班级。
+    每个工作簿构建一次，所有输出工作表共用，查找为 O(1)
+    """
+
+    CLASS_HEADERS = ('班级',)
+    ID_HEADERS = ('学号', '考号')
+
+    def __init__(self, exams: Sequence[ExamSheet], class_col: Optional[int] = None,
+                 id_col: Optional[int] = None):
+        """class_col / id_col 不指定时按表头识别（见 CLASS_HEADERS / ID_HEADERS）"""
+        self.exam_names = [exam.name for exam in exams]
+        self.class_cols = self._columns_for(exams, class_col, self.CLASS_HEADERS)
+        self.id_cols = self._columns_for(exams, id_col, self.ID_HEADERS)
+        self.name_cols = [exam.schema.name_col for exam in exams]
+        
+        self.keys: List[Tuple] = []
+        self.names: List[str] = []
+        self.classes: Optional[List] = [] if self.class_cols is not None else None
+        self.positions: Dict[Tuple, int] = {}
+        # exam_students[j][i]：第 j 次考试中第 i 个学生（ScoreColumns 顺序）的学生序号
+        self.exam_students: List[array] = []
+        # 重复出现的学生：(考试名称, 姓名, 第几次出现)
+        self.duplicates: List[Tuple[str, str, int]] = []
+        
+        for exam_idx, exam in enumerate(exams):
+            self._add_exam(exam_idx, exam)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @staticmethod
+    def _columns_for(exams: Sequence[ExamSheet], col_idx: Optional[int],
+                     headers: Sequence[str]) -> Optional[List[int]]:
+        """各次考试中该列的列号；任何一次考试缺少该列时返回 None（无法用它对齐）"""
+        if col_idx is not None:
+            return [col_idx] * len(exams)
+        found = []
+        for exam in exams:
+            matches = [idx for row in exam.data[:exam.data_start] for idx, value in enumerate(row)
+                       if StudentIndex.normalize(value) in headers]
+            if not matches:
+                return None
+            found.append(matches[0])
+        return found
+
+    @staticmethod
+    def normalize(value) -> str:
+        """规范化姓名/班级/学号：全角转半角、去掉所有空白，整数形式的数值去掉小数点"""
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return ''.join(unicodedata.normalize('NFKC', str(value)).split())
+
+    def _base_key(self, exam_idx: int, row: List) -> Tuple:
+        if self.id_cols is not None:
+            student_id = self.normalize(row[self.id_cols[exam_idx]]) if self.id_cols[exam_idx] < len(row) else ''
+            if student_id:
+                return ('学号', student_id)
+        class_name = ''
+        if self.class_cols is not None and self.class_cols[exam_idx] < len(row):
+            class_name = self.normalize(row[self.class_cols[exam_idx]])
+        return (class_name, self.normalize(row[self.name_cols[exam_idx]]))
+
+    def _add_exam(self, exam_idx: int, exam: ExamSheet):
+        columns = exam.columns
+        students = array('q')
+        seen: Dict[Tuple, int] = {}
+        for student_idx, row_idx in enumerate(columns.rows):
+            base_key = self._base_key(exam_idx, exam.data[row_idx])
+            occurrence = seen.get(base_key, 0)
+            seen[base_key] = occurrence + 1
+            if occurrence:
+                self.duplicates.append((exam.name, columns.names[student_idx], occurrence + 1))
+            
+            key = base_key + (occurrence,)
+            position = self.positions.get(key)
+            if position is None:
+                position = len(self.keys)
+                self.positions[key] = position
+                self.keys.append(key)
+                self.names.append(columns.names[student_idx])
+                if self.classes is not None:
+                    row = exam.data[row_idx]
+                    class_col = self.class_cols[exam_idx]
+                    self.classes.append(row[class_col] if class_col < len(row) else '')
+            students.append(position)
+        self.exam_students.append(students)
+
+    def duplicate_messages(self) -> List[str]:
+        """重复出现的学生（警告信息）"""
+        return [f"「{exam_name}」中「{name}」第 {occurrence} 次出现，按出现次序与其他考试对应"
+                for exam_name, name, occurrence in self.duplicates]
+
+
+class RankAverage:
+    """
+    多次考试的校次均值（均值工作表的计算结果）
+    
+    通过 StudentIndex 对齐各次考试（名单为各次考试的并集，按首次出现的顺序），把校次放进
+    (学生 × 考试) 的 NumPy 矩阵，缺考记为 NaN，一次算出所有学生的均值；
+    按姓名、按均值两种排序都由同一份结果 argsort 得到；
+    学生索引识别出班级列时，均值表在姓名前多写一列班级（同名学生可以区分）
+    """
+
+    def __init__(self, exams: Sequence[ExamSheet], subject: str = '总分', min_exams: Optional[int] = None,
+                 index: Optional[StudentIndex] = None):
+        """
+        min_exams: 至少有几次考试的校次才计算均值（对已有的校次取平均），
+                   默认为考试次数，即任何一次缺失都不计算
+        index: 学生索引，不指定时按这些考试新建
+        """
+        self.exam_names = [exam.name for exam in exams]
+        self.subject = subject
+        self.columns = [exam.columns for exam in exams]
+        for exam in exams:
+            exam.schema.rank_col(subject, exam.name)
+        index = index if index is not None else StudentIndex(exams)
+        self.names = index.names
+        self.classes = index.classes
+        
+        n_students = len(index)
+        n_exams = len(self.columns)
+        # exam_rows[j, i]：第 i 名学生在第 j 次考试中的序号，-1 表示没有成绩
+        self.exam_rows = np.full((n_exams, n_students), -1, dtype=np.intp)
+        self.ranks = np.full((n_students, n_exams), np.nan)
+        for exam_idx, columns in enumerate(self.columns):
+            dst = np.frombuffer(index.exam_students[exam_idx], dtype=np.int64)
+            self.exam_rows[exam_idx, dst] = np.arange(len(dst))
+            self.ranks[dst, exam_idx] = self._numeric_ranks(columns, subject)
+        # 校次 0 视为无效
+        self.ranks[self.ranks == 0] = np.nan
+        
+        present = ~np.isnan(self.ranks)
+        counts = present.sum(axis=1)
+        totals = np.where(present, self.ranks, 0.0).sum(axis=1)
+        required = max(1, n_exams if min_exams is None else min_exams)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.means = np.where(counts >= required, totals / counts, np.nan)
+
+    @staticmethod
+    def _numeric_ranks(columns: ScoreColumns, subject: str) -> np.ndarray:
+        """某科校次转为浮点数组（直接使用列式存储的数组），文本形式的数字也转换"""
+        ranks = np.frombuffer(columns.ranks[subject], dtype=np.float64).copy()
+        subject_idx = columns.subjects.index(subject)
+        for (idx, extra_subject, is_rank), value in columns.extras.items():
+            if is_rank and extra_subject == subject_idx:
+                try:
+                    ranks[idx] = float(value)
+                except (TypeError, ValueError):
+                    pass
+        return ranks
+
+    def order(self, sort_by_name: bool) -> np.ndarray:
+        """学生的输出顺序：按姓名，或按均值升序（无均值的排在最后）"""
+        if sort_by_name:
+            return np.argsort(np.array(self.names, dtype=str), kind='stable')
+        return np.argsort(self.means, kind='stable')
+
+    @staticmethod
+    def header_rows(exam_names: Sequence[str], with_class: bool = False) -> List[List]:
+        """均值工作表的表头和标签行：（班级、）姓名、各次考试的（得分, 校次）、均值"""
+        # 表头
+        headers = ['', ''] if with_class else ['']
+        # 标签行
+        labels = ['班级', '姓名'] if with_class else ['姓名']
+        for exam_idx, exam_name in enumerate(exam_names):
+            headers += [exam_name, '校次' if exam_idx == 0 else '']
+            labels += ['得分' if exam_idx == 0 else '总分', '校次']
+        headers.append('')
+        labels.append('均值')
+        return [headers, labels]
+
+    def sheet_rows(self, sort_by_name: bool) -> Iterator[List]:
+        """逐行生成均值工作表的全部行：表头、标签行和学生数据"""
+        yield from self.header_rows(self.exam_names, with_class=self.classes is not None)
+        for student_idx in self.order(sort_by_name):
+            row = [self.names[student_idx]]
+            if self.classes is not None:
+                row.insert(0, self.classes[student_idx])
+            for exam_idx, columns in enumerate(self.columns):
+                exam_row = self.exam_rows[exam_idx, student_idx]
+                if exam_row < 0:
+                    row += ['', '']
+                    continue
+                score = columns.value(self.subject, exam_row)
+                rank = columns.value(self.subject, exam_row, is_rank=True)
+                row += [score if score else '', rank if rank else '']
+            mean = self.means[student_idx]
+            row.append(float(mean) if mean == mean else '')
+            yield row
+
+
+class ParsedWorkbook:
+    """已解析的工作簿
+
+    同一个文件只解码一次，文件信息汇总（get_file_info）和
+    转换（read_excel_file）共用这份数据。
+    工作表按需解码：只请求部分工作表时，其余工作表不会被解码
+    file_contents 不为空时直接从内存中的文件内容解码，file_path 只作为名称
+    
+    对象可能被缓存（WorkbookCache）并由多个任务同时使用：load 每次返回新的 ExamSheet，
+    行列表是新的，各行与缓存共用（只读，不能原地修改）；列布局、学生数据由各自的
+    ExamSheet 解析，调用方之间互不影响
+    """
+
+    def __init__(self, file_path: str, file_contents: Optional[bytes] = None):
+        self.file_path = file_path
+        self.file_contents = file_contents
+        self.sheet_names: Optional[List[str]] = None
+        self._sheets: Dict[int, ExamSheet] = {}
+        self._meta: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(sheet_names: List[str], keywords: Optional[Sequence]) -> List[int]:
+        """名称包含任一关键字的工作表序号；keywords 为空时返回全部"""
+        if not keywords:
+            return list(range(len(sheet_names)))
+        return [idx for idx, name in enumerate(sheet_names)
+                if any(keyword in name for keyword in keywords)]
+
+    def _decode(self, select: Callable[[List[str]], Dict[int, bool]]):
+        source = self.file_path if self.file_contents is None else self.file_contents
+        self.sheet_names, meta, sheets = ExcelHandler._decode_workbook(source, select)
+        self._meta.update(meta)
+        self._sheets.update(sheets)
+
+    def names(self) -> List[str]:
+        """全部工作表名称（只读取工作簿目录，不解码工作表）"""
+        with self._lock:
+            if self.sheet_names is None:
+                self._decode(lambda sheet_names: {})
+            return self.sheet_names
+
+    def load(self, keywords: Optional[Sequence] = None) -> List[ExamSheet]:
+        """
+        返回工作表列表（按工作簿中的顺序）
+        keywords 不为空时只返回（并只解码）名称包含任一关键字的工作表；
+        每次返回新的 ExamSheet（见类说明）
+        """
+        with self._lock:
+            def select(sheet_names: List[str]) -> Dict[int, bool]:
+                return {idx: True for idx in self._match(sheet_names, keywords) if idx not in self._sheets}
+
+            if self.sheet_names is None or select(self.sheet_names):
+                self._decode(select)
+            sheets = [self._sheets[idx] for idx in self._match(self.sheet_names, keywords)]
+        # 缓存中的工作表不交给调用方：浅复制行列表，解析结果各自保存
+        return [ExamSheet(sheet.name, list(sheet.data)) for sheet in sheets]
+
+    @property
+    def sheets(self) -> List[ExamSheet]:
+        """全部工作表"""
+        return self.load()
+
+    def info(self, keywords: Optional[Sequence] = None) -> Dict:
+        """
+        汇总工作表信息，格式与 get_file_info 的返回值一致
+        只读取行列数和姓名列，不构建行数据；
+        名称匹配 keywords 的工作表（转换时要用）顺带保留数据，避免再次解码
+        """
+        with self._lock:
+            def select(sheet_names: List[str]) -> Dict[int, bool]:
+                keep = set(self._match(sheet_names, keywords)) if keywords else set()
+                return {idx: idx in keep and idx not in self._sheets
+                        for idx in range(len(sheet_names)) if idx not in self._meta}
+
+            if self.sheet_names is None or select(self.sheet_names):
+                self._decode(select)
+            sheets_info = [self._meta[idx] for idx in range(len(self.sheet_names))]
+
+        return {
+            'success': True,
+            'sheets': sheets_info,
+            'total_sheets': len(sheets_info)
+        }
+
+
+class WorkbookCache:
+    """已解析工作簿的 LRU 缓存
+
+    以（绝对路径, 修改时间, 文件大小）为键，文件被覆盖后自动失效
+    """
+
+    def __init__(self, max_entries: int = 8):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, ParsedWorkbook]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(file_path: str) -> Tuple:
+        stat = os.stat(file_path)
+        return (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+
+    def get(self, file_path: str) -> ParsedWorkbook:
+        """获取工作簿对象，工作表在首次请求时才解码"""
+        key = self._key(file_path)
+        with self._lock:
+            workbook = self._entries.get(key)
+            if workbook is None:
+                workbook = ParsedWorkbook(file_path)
+                self._entries[key] = workbook
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return workbook
+
+    def discard(self, file_path: str):
+        """丢弃某个文件的缓存（文件被删除时）"""
+        path = os.path.abspath(file_path)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                del self._entries[key]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+class XlsxSheet:
+    """
+    xlsx 输出工作表（openpyxl 只写模式）
+    行写出后立即序列化到临时文件，内存占用与行数无关；
+    只能按顺序追加行，格式设置必须在写出数据之前完成
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.nrows = 0
+
+    def emit_rows(self, prepared_rows: Iterable[List[Tuple]], start_row: int = 0) -> int:
+        """逐行写出预处理行（见 ExcelHandler._prepare_rows），返回下一个空行的行号"""
+        append = self.worksheet.append
+        for _ in range(self.nrows, start_row):
+            append([])
+        self.nrows = max(self.nrows, start_row)
+        
+        for cells in prepared_rows:
+            row = [None] * (cells[-1][1] + 1 if cells else 0)
+            for kind, col_idx, value in cells:
+                if kind == CELL_TEXT and value.startswith('='):
+                    # 以 = 开头的文本按文本写出，不作为公式
+                    value = WriteOnlyCell(self.worksheet, value=value)
+                    value.data_type = 's'
+                row[col_idx] = value
+            append(row)
+            self.nrows += 1
+        return self.nrows
+
+    def setup_print(self, ncols: int):
+        """打印版格式，与 xls 版一致（见 ExcelHandler._setup_print_sheet）"""
+        ws = self.worksheet
+        ws.page_setup.paperSize = 9  # A4
+        ws.page_setup.orientation = 'portrait'
+        ws.sheet_properties.pageSetUpPr.fitToPage = True
+        ws.page_setup.fitToWidth = 1
+        ws.page_setup.fitToHeight = 0  # 高度不限页数
+        ws.print_options.gridLines = True
+        ws.print_options.horizontalCentered = True
+        ws.freeze_panes = 'A3'
+        for col_idx in range(ncols):
+            ws.column_dimensions[get_column_letter(col_idx + 1)].width = 10 if col_idx < 2 else 7
+
+
+class XlsxWorkbook:
+    """xlsx 输出工作簿，提供与 xlwt.Workbook 相同的 add_sheet / save"""
+
+    def __init__(self):
+        self.workbook = openpyxl.Workbook(write_only=True)
+
+    def add_sheet(self, sheet_name: str) -> XlsxSheet:
+        return XlsxSheet(self.workbook.create_sheet(sheet_name))
+
+    def save(self, output_path):
+        self.workbook.save(output_path)
 
 
 class ExcelHandler:
     """Excel 文件处理器"""
+
+    # 转换所需的两次考试工作表（名称关键字）
+    EXAM_KEYWORDS = ('一调', '期中')
+
+    # 上传信息和转换共用的工作簿缓存
+    workbook_cache = WorkbookCache()
     
+    # 输出格式：xls（xlwt，最多 65536 行）或 xlsx（openpyxl 只写模式）
+    OUTPUT_FORMATS = ('xls', 'xlsx')
+    # 尖子生并列处理方式（见 select_top_students）
+    TOP_TIES = ('first', 'include')
+
+    @staticmethod
+    def load_workbook(file_path: str) -> ParsedWorkbook:
+        """
+        加载工作簿（带缓存）
+        同一个文件在上传预览和转换之间只解码一次
+        """
+        return ExcelHandler.workbook_cache.get(file_path)
+
+    @staticmethod
+    def load_contents(file_contents: bytes, file_name: str = '') -> ParsedWorkbook:
+        """
+        从内存中的文件内容加载工作簿（如上传的数据），不经过磁盘
+        返回的对象可以先用于 info() 预览，再用于 load() 转换，只解码一次
+        """
+        return ParsedWorkbook(file_name, file_contents)
+
     @staticmethod
-    def read_excel_file(file_path: str) -> List[ExamSheet]:
+    def read_excel_file(file_path: str, parse_students: bool = True,
+                        keywords: Optional[Sequence] = None,
+                        file_contents: Optional[bytes] = None) -> List[ExamSheet]:
         """
         读取 Excel 文件
         返回所有工作表的数据
         
         保持原始格式不变，直接复制所有数据
+        学生数据在首次访问 ExamSheet.students 时才解析；
+        parse_students=False 则完全跳过解析（只复制工作表的流程），这些工作表不能交给 write_excel_file
+        keywords 不为空时只解码名称包含其中任一关键字的工作表，
+        如 ExcelHandler.EXAM_KEYWORDS
+        file_contents 不为空时从内存中的文件内容读取（同 xlrd），file_path 只作为名称
         """
-        workbook = xlrd.open_workbook(file_path, formatting_info=False)
-        sheets = []
+        if file_contents is not None:
+            workbook = ExcelHandler.load_contents(file_contents, file_path)
+        else:
+            workbook = ExcelHandler.load_workbook(file_path)
+        sheets = workbook.load(keywords)
+        if parse_students:
+            return sheets
+        return [ExamSheet(sheet.name, sheet.data, parse_students=False) for sheet in sheets]
+
+    @staticmethod
+    def _decode_workbook(source, select: Callable[[List[str]], Dict[int, bool]]
+                         ) -> Tuple[List[str], Dict[int, Dict], Dict[int, ExamSheet]]:
+        """
+        解码工作簿（按文件内容区分 xls / xlsx）
+        source 为文件路径，或内存中的文件内容（bytes）
+        select 接收全部工作表名称，返回 {需要解码的工作表序号: 是否保留行数据}
+        返回 (全部工作表名称, {序号: 工作表信息}, {序号: 工作表})
+        """
+        if ExcelHandler._is_xlsx(source):
+            return ExcelHandler._decode_xlsx_workbook(source, select)
         
-        for sheet_idx in range(workbook.nsheets):
-            sheet = workbook.sheet_by_index(sheet_idx)
-            
-            # 读取所有数据
-            data = []
-            for row_idx in range(sheet.nrows):
-                row = []
-                for col_idx in range(sheet.ncols):
-                    cell = sheet.cell(row_idx, col_idx)
-                    if cell.ctype == xlrd.XL_CELL_NUMBER:
-                        val = cell.value
-                        # 保持数值精度
-                        row.append(val)
-                    elif cell.ctype == xlrd.XL_CELL_EMPTY:
-                        row.append('')
-                    else:
-                        row.append(str(cell.value))
-                data.append(row)
-            
-            # 创建工作表对象
-            exam_sheet = ExamSheet(sheet.name, data)
-            exam_sheet.parse_data()
-            sheets.append(exam_sheet)
+        if isinstance(source, (bytes, bytearray)):
+            return ExcelHandler._decode_xls_contents(source, select)
         
-        return sheets
+        # 通过 mmap 把文件交给 xlrd，不再整体读入一份 bytes
+        with open(source, 'rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contents:
+            return ExcelHandler._decode_xls_contents(contents, select)
     
     @staticmethod
-    def write_excel_file(sheets: List[ExamSheet], output_path: str):
+    def _decode_xls_contents(contents, select: Callable[[List[str]], Dict[int, bool]]
+                             ) -> Tuple[List[str], Dict[int, Dict], Dict[int, ExamSheet]]:
+        """
+        用 xlrd 解码 xls 文件内容（bytes 或 mmap）
+        on_demand=True 时只解析工作簿全局信息，工作表在用到时才解码
+        """
+        meta = {}
+        sheets = {}
+        workbook = xlrd.open_workbook(file_contents=contents, formatting_info=False, on_demand=True)
+        try:
+            sheet_names = workbook.sheet_names()
+            for sheet_idx, keep_rows in select(sheet_names).items():
+                sheet = workbook.sheet_by_index(sheet_idx)
+                # 统计学生数量：按表头找到姓名列，一次取出整列姓名
+                head = [sheet.row_values(row_idx) for row_idx in range(min(sheet.nrows, SheetSchema.MAX_HEADER_ROWS))]
+                header_idx, name_col = SheetSchema.locate(head) or (0, 1)
+                names = sheet.col_values(name_col, header_idx + 1) if sheet.ncols > name_col else []
+                meta[sheet_idx] = {
+                    'name': sheet.name,
+                    'rows': sheet.nrows,
+                    'cols': sheet.ncols,
+                    'student_count': sum(1 for name in names if name)
+                }
+                if keep_rows:
+                    # 创建工作表对象（学生数据延迟解析）
+                    sheets[sheet_idx] = ExamSheet(sheet.name, ExcelHandler._read_sheet_rows(sheet))
+                workbook.unload_sheet(sheet_idx)
+        finally:
+            workbook.release_resources()
+        
+        return sheet_names, meta, sheets
+    
+    @staticmethod
+    def _is_xlsx(source) -> bool:
+        """xlsx 是 zip 包，按文件头判断，不依赖扩展名"""
+        if isinstance(source, (bytes, bytearray)):
+            return source[:4] == b'PK\x03\x04'
+        with open(source, 'rb') as f:
+            return f.read(4) == b'PK\x03\x04'
+    
+    @staticmethod
+    def _decode_xlsx_workbook(source, select: Callable[[List[str]], Dict[int, bool]]
+                              ) -> Tuple[List[str], Dict[int, Dict], Dict[int, ExamSheet]]:
+        """
+        用 openpyxl 只读模式流式读取 xlsx
+        逐行取值，不在内存中构建单元格对象；未选中的工作表不会被读取
+        """
+        meta = {}
+        sheets = {}
+        # 传入文件对象：openpyxl 按扩展名校验文件名，.xls 后缀的 xlsx 文件会被拒绝
+        f = io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else open(source, 'rb')
+        with f:
+            workbook = openpyxl.load_workbook(f, read_only=True, data_only=True)
+            try:
+                sheet_names = list(workbook.sheetnames)
+                for sheet_idx, keep_rows in select(sheet_names).items():
+                    worksheet = workbook.worksheets[sheet_idx]
+                    data = ExcelHandler._read_xlsx_rows(worksheet)
+                    header_idx, name_col = SheetSchema.locate(data) or (0, 1)
+                    meta[sheet_idx] = {
+                        'name': worksheet.title,
+                        'rows': len(data),
+                        'cols': len(data[0]) if data else 0,
+                        'student_count': sum(1 for row in data[header_idx + 1:]
+                                             if len(row) > name_col and row[name_col])
+                    }
+                    if keep_rows:
+                        sheets[sheet_idx] = ExamSheet(worksheet.title, data)
+            finally:
+                workbook.close()
+        return sheet_names, meta, sheets
+    
+    @staticmethod
+    def _read_xlsx_rows(worksheet) -> List[List]:
+        """
+        读取 xlsx 工作表数据，转换为与 xlrd 读取结果相同的结构：
+        数值为 float，空单元格为 ''，其他值转为字符串，
+        每行补齐到相同列数，去掉末尾的空行
+        """
+        # 部分导出工具写入的尺寸信息不可靠，按实际单元格读取
+        worksheet.reset_dimensions()
+        data = []
+        ncols = 0
+        nrows = 0
+        for values in worksheet.iter_rows(values_only=True):
+            row = []
+            width = 0
+            for col_idx, value in enumerate(values):
+                if value is None:
+                    row.append('')
+                    continue
+                if isinstance(value, bool):
+                    value = str(int(value))  # 与 xlrd 的布尔单元格一致
+                elif isinstance(value, (int, float)):
+                    value = float(value)
+                else:
+                    value = str(value)
+                row.append(value)
+                if value != '':
+                    width = col_idx + 1
+            data.append(row)
+            if width:
+                ncols = max(ncols, width)
+                nrows = len(data)
+        
+        del data[nrows:]
+        for row in data:
+            if len(row) < ncols:
+                row.extend([''] * (ncols - len(row)))
+            elif len(row) > ncols:
+                del row[ncols:]
+        return data
+    
+    @staticmethod
+    def _read_sheet_rows(sheet) -> List[List]:
+        """
+        按行批量读取工作表数据
+        每行只调用一次 row_values/row_types，不再逐个创建 Cell 对象
+        """
+        number = xlrd.XL_CELL_NUMBER
+        empty = xlrd.XL_CELL_EMPTY
+        data = []
+        for row_idx in range(sheet.nrows):
+            values = sheet.row_values(row_idx)
+            types = sheet.row_types(row_idx)
+            data.append([
+                value if ctype == number else ('' if ctype == empty else str(value))
+                for value, ctype in zip(values, types)
+            ])
+        return data
+    
+    @staticmethod
+    def order_exams(sheets: List[ExamSheet], exam_order: Optional[Sequence[str]] = None) -> List[ExamSheet]:
+        """
+        按考试顺序排列考试工作表
+        exam_order 为名称关键字序列（默认 EXAM_KEYWORDS），工作表按第一个匹配的关键字排序，
+        同一关键字匹配多张表时保持工作簿中的顺序；不匹配任何关键字的工作表被忽略
+        """
+        exam_order = exam_order or ExcelHandler.EXAM_KEYWORDS
+        ordered = []
+        for sheet_idx, sheet in enumerate(sheets):
+            for order_idx, keyword in enumerate(exam_order):
+                if keyword in sheet.name:
+                    ordered.append((order_idx, sheet_idx, sheet))
+                    break
+        ordered.sort(key=lambda item: item[:2])
+        return [sheet for _, _, sheet in ordered]
+    
+    @staticmethod
+    def write_excel_file(sheets: List[ExamSheet], output_path, top_n: int = 20,
+                         top_subjects: Sequence[str] = ('总分',), top_ties: str = 'first',
+                         min_exams: Optional[int] = None, exam_order: Optional[Sequence[str]] = None,
+                         top_exam: int = 0, output_format: str = 'xls') -> List[str]:
         """
         写入 Excel 文件
         生成8个工作表的标准格式
         
-        输入: 2个工作表（高二一调、高二期中）
-        输出: 8个工作表
+        输入: 2个或更多考试工作表（默认为高二一调、高二期中）
+        输出: 历次成绩原始/打印、尖子生成绩、高一期末、各次考试复制、两张均值表
+        output_path 可以是文件路径，也可以是可写的文件对象（如 io.BytesIO）
+        output_format 输出格式：'xls' 或 'xlsx'（行数超过 xls 上限 65536 时使用）
+        
+        exam_order 考试顺序（名称关键字，见 order_exams），支持任意多次考试
+        尖子生筛选：top_exam 取第几次考试（默认第一次），top_n 名额，
+        top_subjects 按哪些科目的校次筛选，top_ties 并列处理方式（见 select_top_students）
+        min_exams 至少有几次考试的校次才计算均值，默认要求每次都有（见 RankAverage）
+        
+        返回警告信息列表（同一次考试中重复出现的学生，见 StudentIndex.duplicate_messages）
         """
-        workbook = xlwt.Workbook(encoding='utf-8')
+        if output_format not in ExcelHandler.OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        exams = ExcelHandler.order_exams(sheets, exam_order)
+        if len(exams) < 2:
+            keywords = '、'.join(exam_order or ExcelHandler.EXAM_KEYWORDS)
+            raise ValueError(f"输入文件必须包含至少两次考试的工作表（名称包含：{keywords}）")
+        if not 0 <= top_exam < len(exams):
+            raise ValueError(f"尖子生考试序号 {top_exam} 超出范围（共 {len(exams)} 次考试，从 0 开始）")
+        if len(set(top_subjects)) != len(top_subjects):
+            raise ValueError(f"尖子生科目有重复：{'、'.join(top_subjects)}")
+        # 均值表、尖子生表需要各次考试的学生成绩
+        unparsed = [exam.name for exam in exams if not exam.parse_students]
+        if unparsed:
+            raise ValueError(f"工作表「{'、'.join(unparsed)}」读取时未解析学生（parse_students=False），无法生成历次成绩")
+        # 合并表按第一次考试的表头写出，各次考试的科目列必须一致
+        for exam in exams[1:]:
+            if exam.schema.layout != exams[0].schema.layout:
+                raise ValueError(f"工作表「{exam.name}」的科目列与「{exams[0].name}」不一致，无法合并")
+        
+        workbook = XlsxWorkbook() if output_format == 'xlsx' else xlwt.Workbook(encoding='utf-8')
+        
+        prepare = ExcelHandler._prepare_rows
+        if output_format == 'xlsx':
+            # 只写模式逐行写出：每张表写出时才预处理，预处理行不整体保存，内存占用与学生数无关
+            def exam_rows(exam_idx: int, start: int = 0) -> Iterable[List[Tuple]]:
+                return prepare(islice(exams[exam_idx].data, start, None))
+        else:
+            # xlwt 在内存中保存整个工作簿，无法逐行写出；
+            # 每行只判断一次单元格类型，合并表和复制表共用
+            shared_rows = [list(prepare(exam.data)) for exam in exams]
+            
+            def exam_rows(exam_idx: int, start: int = 0) -> Iterable[List[Tuple]]:
+                return islice(shared_rows[exam_idx], start, None)
         
-        # 找到两个输入工作表
-        sheet_yidiao = None
-        sheet_qizhong = None
+        # 表头和标签行（第一次考试的表头部分）按文本写出，之后依次是各次考试的数据行
+        first_exam = exams[0]
         
-        for sheet in sheets:
-            if '一调' in sheet.name:
-                sheet_yidiao = sheet
-            elif '期中' in sheet.name:
-                sheet_qizhong = sheet
+        def merged_rows() -> Iterable[List[Tuple]]:
+            return ExcelHandler._merge_rows(
+                prepare(first_exam.data[:first_exam.data_start], as_text=True),
+                [exam_rows(exam_idx, exam.data_start) for exam_idx, exam in enumerate(exams)])
         
-        if not sheet_yidiao or not sheet_qizhong:
-            raise ValueError("输入文件必须包含'高二一调'和'高二期中'两个工作表")
+        merged_cols = max(chain((len(row) for row in first_exam.data[:first_exam.data_start]),
+                                (len(row) for exam in exams for row in islice(exam.data, exam.data_start, None))),
+                          default=0)
         
-        # 工作表1: 历次成绩原始 - 合并两次考试
-        ExcelHandler._write_merged_sheet(workbook, "历次成绩原始", sheet_yidiao, sheet_qizhong)
+        # 工作表1: 历次成绩原始 - 合并历次考试
+        ExcelHandler._write_rows_sheet(workbook, "历次成绩原始", merged_rows())
         
-        # 工作表2: 历次成绩打印 - 合并两次考试
-        ExcelHandler._write_merged_sheet(workbook, "历次成绩打印", sheet_yidiao, sheet_qizhong)
+        # 工作表2: 历次成绩打印 - 合并历次考试，附加打印格式
+        ExcelHandler._write_rows_sheet(workbook, "历次成绩打印", merged_rows(),
+                                       setup=ExcelHandler._setup_print_sheet, ncols=merged_cols)
         
-        # 工作表3: 尖子生成绩 - 筛选排名前20的学生
-        ExcelHandler._write_top_students_sheet(workbook, "尖子生成绩", sheet_yidiao, sheet_qizhong)
+        # 工作表3: 尖子生成绩 - 筛选排名前 top_n 的学生
+        # 多个科目时一次遍历选出，第一个科目写入"尖子生成绩"，其余科目各自追加一张表
+        top_sheet = exams[top_exam]
+        top_students = ExcelHandler.select_top_students(top_sheet, top_n, top_subjects, top_ties)
+        for subject_idx, subject in enumerate(top_subjects):
+            sheet_name = "尖子生成绩" if subject_idx == 0 else f"尖子生成绩 {subject}"
+            ExcelHandler._write_top_students_sheet(workbook, sheet_name, top_sheet, top_students[subject])
         
-        # 工作表4: 高一期末 - 空表
-        ExcelHandler._write_empty_sheet(workbook, "高一期末")
+        # 工作表4: 高一期末 - 空表（输入中已有该考试时不再生成）
+        if all(exam.name != "高一期末" for exam in exams):
+            ExcelHandler._write_empty_sheet(workbook, "高一期末", exams[0].schema)
         
-        # 工作表5: 高二一调 - 直接复制
-        ExcelHandler._write_single_sheet(workbook, sheet_yidiao)
+        # 工作表5+: 各次考试 - 直接复制
+        for exam_idx, exam in enumerate(exams):
+            ExcelHandler._write_single_sheet(workbook, exam.name, exam_rows(exam_idx))
         
-        # 工作表6: 高二期中 - 直接复制
-        ExcelHandler._write_single_sheet(workbook, sheet_qizhong)
+        # 学生索引每个工作簿只构建一次，排名均值只计算一次，两种排序共用
+        index = StudentIndex(exams)
+        average = RankAverage(exams, min_exams=min_exams, index=index)
         
-        # 工作表7: 均值 姓名排序 - 计算两次排名均值
-        ExcelHandler._write_average_sheet(workbook, "均值 姓名排序", sheet_yidiao, sheet_qizhong, sort_by_name=True)
+        # 均值 姓名排序 - 计算历次排名均值
+        ExcelHandler._write_average_sheet(workbook, "均值 姓名排序", average, sort_by_name=True)
         
-        # 工作表8: 两次 均值 升序 - 按均值排序
-        ExcelHandler._write_average_sheet(workbook, "两次 均值 升序", sheet_yidiao, sheet_qizhong, sort_by_name=False)
+        # 两次 均值 升序 - 按均值排序
+        ExcelHandler._write_average_sheet(workbook, ExcelHandler.ascending_sheet_name(len(exams)),
+                                          average, sort_by_name=False)
         
         workbook.save(output_path)
+        return index.duplicate_messages()
     
     @staticmethod
-    def _write_single_sheet(workbook, exam_sheet: ExamSheet):
-        """写入单个工作表（直接复制）"""
-        ws = workbook.add_sheet(exam_sheet.name)
-        
-        for row_idx, row_data in enumerate(exam_sheet.data):
-            for col_idx, cell_value in enumerate(row_data):
-                if isinstance(cell_value, (int, float)):
-                    ws.write(row_idx, col_idx, cell_value)
+    def ascending_sheet_name(exam_count: int) -> str:
+        """按均值升序的工作表名称：两次考试为"两次 均值 升序"，其他为"N次 均值 升序"（N 为考试次数）"""
+        return "两次 均值 升序" if exam_count == 2 else f"{exam_count}次 均值 升序"
+    
+    @staticmethod
+    def _prepare_rows(rows: Iterable[List], as_text: bool = False) -> Iterator[List[Tuple]]:
+        """
+        逐行预处理待写出的行（生成器，写出时才处理，不整体保存）
+        每个单元格只判断一次类型，得到 (类型, 列号, 值)；需要写入多个工作表时由调用方保存为列表
+        as_text=True 时数值也按文本写出（表头行）
+        """
+        for row in rows:
+            cells = []
+            for col_idx, cell_value in enumerate(row):
+                if not as_text and isinstance(cell_value, (int, float)):
+                    cells.append((CELL_NUMBER, col_idx, cell_value))
                 else:
-                    ws.write(row_idx, col_idx, str(cell_value))
+                    text = str(cell_value)
+                    # 与 xlwt 的 write 一致：空字符串写为空白单元格
+                    cells.append((CELL_TEXT, col_idx, text) if text else (CELL_BLANK, col_idx, None))
+            yield cells
     
     @staticmethod
-    def _write_merged_sheet(workbook, sheet_name: str, sheet1: ExamSheet, sheet2: ExamSheet):
-        """写入合并两次考试的工作表"""
-        ws = workbook.add_sheet(sheet_name)
+    def _emit_rows(ws, prepared_rows: Iterable[List[Tuple]], start_row: int = 0) -> int:
+        """
+        按行写出预处理行（可以是生成器，逐行取用），返回下一个空行的行号
         
-        # 写入表头（从sheet1复制）
-        for col_idx, cell_value in enumerate(sheet1.data[0]):
-            ws.write(0, col_idx, str(cell_value))
+        xlwt 的 write 对每个单元格都要注册样式、调整行高和列范围，
+        这里默认样式只注册一次，中间单元格直接构造 Cell 插入；
+        每行首尾两个单元格仍走公开的 set_cell_* 方法，
+        由 xlwt 维护行高和行/表的列范围，输出与逐个 write 完全一致
+        xlsx 工作表（XlsxSheet）按行追加
+        """
+        if isinstance(ws, XlsxSheet):
+            return ws.emit_rows(prepared_rows, start_row)
         
-        # 写入标签行（从sheet1复制）
-        for col_idx, cell_value in enumerate(sheet1.data[1]):
-            ws.write(1, col_idx, str(cell_value))
+        workbook = ws.get_parent()
+        xf_index = workbook.add_style(xlwt.Style.default_style)
+        add_str = workbook.add_str
         
-        # 写入sheet1的数据
-        row_idx = 2
-        for data_row in sheet1.data[2:]:
-            for col_idx, cell_value in enumerate(data_row):
-                if isinstance(cell_value, (int, float)):
-                    ws.write(row_idx, col_idx, cell_value)
-                else:
-                    ws.write(row_idx, col_idx, str(cell_value))
-            row_idx += 1
-        
-        # 写入sheet2的数据
-        for data_row in sheet2.data[1:]:  # 跳过sheet2的表头
-            for col_idx, cell_value in enumerate(data_row):
-                if isinstance(cell_value, (int, float)):
-                    ws.write(row_idx, col_idx, cell_value)
+        row_idx = start_row
+        for cells in prepared_rows:
+            row = ws.row(row_idx)
+            setters = (row.set_cell_number, row.set_cell_text)
+            insert = row.insert_cell
+            last = len(cells) - 1
+            for cell_idx, (kind, col_idx, value) in enumerate(cells):
+                if cell_idx == 0 or cell_idx == last:
+                    if kind == CELL_BLANK:
+                        row.set_cell_blank(col_idx)
+                    else:
+                        setters[kind](col_idx, value)
+                elif kind == CELL_NUMBER:
+                    insert(col_idx, NumberCell(row_idx, col_idx, xf_index, value))
+                elif kind == CELL_TEXT:
+                    insert(col_idx, StrCell(row_idx, col_idx, xf_index, add_str(value)))
                 else:
-                    ws.write(row_idx, col_idx, str(cell_value))
+                    insert(col_idx, BlankCell(row_idx, col_idx, xf_index))
             row_idx += 1
+        return row_idx
+    
+    @staticmethod
+    def _write_single_sheet(workbook, sheet_name: str, rows: Iterable[List[Tuple]]):
+        """写入单个工作表（直接复制）"""
+        ExcelHandler._write_rows_sheet(workbook, sheet_name, rows)
     
     @staticmethod
-    def _write_top_students_sheet(workbook, sheet_name: str, sheet1: ExamSheet, sheet2: ExamSheet):
-        """写入尖子生工作表（筛选排名前20的学生）"""
+    def _write_rows_sheet(workbook, sheet_name: str, rows: Iterable[List[Tuple]],
+                          setup: Optional[Callable] = None, ncols: int = 0):
+        """
+        新建工作表并写出预处理行
+        setup(ws, ncols) 用于设置页面、列宽等格式，不改变数据；ncols 为列数（行在写出时才生成，需预先给出）
+        """
         ws = workbook.add_sheet(sheet_name)
+        if setup:
+            setup(ws, ncols)
+        ExcelHandler._emit_rows(ws, rows)
+    
+    @staticmethod
+    def _merge_rows(header_rows: Iterable[List[Tuple]],
+                    exam_rows: Sequence[Iterable[List[Tuple]]]) -> Iterator[List[Tuple]]:
+        """
+        合并历次考试的行（逐行取用，不拼接成列表）
+        表头和标签行（从第一次考试复制）+ 按考试顺序依次拼接各次考试的数据行
+        """
+        return chain(header_rows, *exam_rows)
+    
+    @staticmethod
+    def _setup_print_sheet(ws, ncols: int):
+        """打印版格式：A4 纵向、宽度缩放到一页、冻结表头、打印网格线，ncols 为列数"""
+        if isinstance(ws, XlsxSheet):
+            ws.setup_print(ncols)
+            return
         
-        # 写入表头
-        for col_idx, cell_value in enumerate(sheet1.data[0]):
-            ws.write(0, col_idx, str(cell_value))
+        ws.paper_size_code = 9  # A4
+        ws.portrait = True
+        ws.fit_num_pages = 1
+        ws.fit_width_to_pages = 1
+        ws.fit_height_to_pages = 0  # 高度不限页数
+        ws.print_grid = True
+        ws.print_centered_horz = True
         
-        # 写入标签行
-        for col_idx, cell_value in enumerate(sheet1.data[1]):
-            ws.write(1, col_idx, str(cell_value))
+        # 冻结表头和标签行
+        ws.panes_frozen = True
+        ws.horz_split_pos = 2
+        ws.horz_split_first_visible = 2
         
-        # 收集所有学生的总排名（从总分校次列）
-        students_with_rank = []
-        for data_row in sheet1.data[2:]:
-            if len(data_row) >= 2 and data_row[1]:
-                total_rank = data_row[15] if len(data_row) > 15 else 9999
-                try:
-                    total_rank = int(total_rank) if isinstance(total_rank, (int, float)) else 9999
-                except:
-                    total_rank = 9999
-                students_with_rank.append((total_rank, data_row))
+        # 列宽（单位为 1/256 字符宽）：考试名称、姓名稍宽，成绩和校次列收窄
+        for col_idx in range(ncols):
+            width = 10 if col_idx < 2 else 7
+            ws.col(col_idx).width = width * 256
+    
+    @staticmethod
+    def _rank_value(value) -> int:
+        """校次转为整数，缺失或非数值记为 MISSING_RANK（排在最后）"""
+        if isinstance(value, (int, float)):
+            try:
+                return int(value)
+            except (ValueError, OverflowError):
+                pass
+        return MISSING_RANK
+    
+    @staticmethod
+    def select_top_students(sheet: ExamSheet, top_n: int = 20, subjects: Sequence[str] = ('总分',),
+                            ties: str = 'first', start_row: Optional[int] = None) -> Dict[str, List[int]]:
+        """
+        按科目校次筛选尖子生
+        只遍历一次数据行取出各科校次，再用 heapq.nsmallest 选出前 top_n 名
+        
+        ties='first'：恰好 top_n 名，同名次按表中顺序（与完整排序后截取一致）
+        ties='include'：与第 top_n 名同名次的学生全部保留
+        start_row 默认为工作表的第一行学生数据（ExamSheet.data_start）
+        返回 {科目: [数据行序号, ...]}，按校次升序
+        """
+        if start_row is None:
+            start_row = sheet.data_start
+        if ties not in ExcelHandler.TOP_TIES:
+            raise ValueError(f"不支持的并列处理方式: {ties}")
+        
+        schema = sheet.schema
+        rank_cols = {subject: schema.rank_col(subject, sheet.name) for subject in subjects}
+        name_col = schema.name_col
+        candidates = {subject: [] for subject in subjects}
+        for data_idx in range(start_row, len(sheet.data)):
+            data_row = sheet.data[data_idx]
+            if len(data_row) > name_col and data_row[name_col]:
+                for subject, col_idx in rank_cols.items():
+                    rank = data_row[col_idx] if col_idx < len(data_row) else None
+                    candidates[subject].append((ExcelHandler._rank_value(rank), data_idx))
+        
+        selected = {}
+        for subject, ranked in candidates.items():
+            # (校次, 行号) 作为键，同名次时保持表中顺序
+            top = heapq.nsmallest(top_n, ranked)
+            if ties == 'include' and top and len(top) == top_n and top[-1][0] != MISSING_RANK:
+                threshold, last_idx = top[-1]
+                top += [item for item in ranked if item[0] == threshold and item[1] > last_idx]
+            selected[subject] = [data_idx for _, data_idx in top]
+        return selected
+    
+    @staticmethod
+    def _write_top_students_sheet(workbook, sheet_name: str, sheet: ExamSheet, top_indices: List[int]):
+        """写入尖子生工作表（按校次筛选出的学生，见 select_top_students）"""
+        ws = workbook.add_sheet(sheet_name)
         
-        # 按排名排序，取前20
-        students_with_rank.sort(key=lambda x: x[0])
-        top_students = [row for _, row in students_with_rank[:20]]
+        # 写入表头和标签行（按文本写出）
+        row_idx = ExcelHandler._emit_rows(
+            ws, ExcelHandler._prepare_rows(sheet.data[:sheet.data_start], as_text=True))
         
         # 写入尖子生数据
-        row_idx = 2
-        for data_row in top_students:
-            for col_idx, cell_value in enumerate(data_row):
-                if isinstance(cell_value, (int, float)):
-                    ws.write(row_idx, col_idx, cell_value)
-                else:
-                    ws.write(row_idx, col_idx, str(cell_value))
-            row_idx += 1
+        ExcelHandler._emit_rows(
+            ws, ExcelHandler._prepare_rows(sheet.data[data_idx] for data_idx in top_indices), row_idx)
     
     @staticmethod
-    def _write_empty_sheet(workbook, sheet_name: str):
-        """写入空表（高一期末）"""
+    def _write_empty_sheet(workbook, sheet_name: str, schema: Optional[SheetSchema] = None):
+        """写入空表（高一期末），只有表头和标签行，科目列与输入的考试一致"""
         ws = workbook.add_sheet(sheet_name)
-        # 只写表头
-        headers = ['班级', '姓名', '语文', '', '数学', '', '英语', '', '物理', '', '化学', '', '生物', '', '总分', '校次']
-        for col_idx, header in enumerate(headers):
-            ws.write(0, col_idx, header)
-        
-        # 写标签行
-        labels = ['', '', '得分', '校次', '得分', '校次', '得分', '校次', '得分', '校次', '得分', '校次', '得分', '校次', '得分', '校次']
-        for col_idx, label in enumerate(labels):
-            ws.write(1, col_idx, label)
+        schema = schema if schema is not None else SheetSchema.default()
+        ExcelHandler._emit_rows(ws, ExcelHandler._prepare_rows(schema.template_rows()))
     
     @staticmethod
-    def _write_average_sheet(workbook, sheet_name: str, sheet1: ExamSheet, sheet2: ExamSheet, sort_by_name: bool = True):
+    def _write_average_sheet(workbook, sheet_name: str, average: 'RankAverage', sort_by_name: bool = True):
         """写入均值工作表"""
         ws = workbook.add_sheet(sheet_name)
-        
-        # 构建学生数据字典
-        students_data = {}
-        
-        # 从sheet1（高二一调）读取数据
-        for data_row in sheet1.data[2:]:
-            if len(data_row) >= 2 and data_row[1]:
-                name = str(data_row[1]).strip()
-                total_score1 = data_row[14] if len(data_row) > 14 else None
-                rank1 = data_row[15] if len(data_row) > 15 else None
-                students_data[name] = {
-                    'score1': total_score1,
-                    'rank1': rank1,
-                    'score2': None,
-                    'rank2': None
-                }
-        
-        # 从sheet2（高二期中）读取数据
-        for data_row in sheet2.data[1:]:
-            if len(data_row) >= 2 and data_row[1]:
-                name = str(data_row[1]).strip()
-                total_score2 = data_row[14] if len(data_row) > 14 else None
-                rank2 = data_row[15] if len(data_row) > 15 else None
-                
-                if name in students_data:
-                    students_data[name]['score2'] = total_score2
-                    students_data[name]['rank2'] = rank2
-        
-        # 计算均值
-        for name in students_data:
-            rank1 = students_data[name]['rank1']
-            rank2 = students_data[name]['rank2']
-            
-            if rank1 and rank2:
-                try:
-                    rank1_val = float(rank1)
-                    rank2_val = float(rank2)
-                    avg = (rank1_val + rank2_val) / 2
-                    students_data[name]['avg'] = avg
-                except:
-                    students_data[name]['avg'] = 9999
-            else:
-                students_data[name]['avg'] = 9999
-        
-        # 排序
-        if sort_by_name:
-            sorted_students = sorted(students_data.items(), key=lambda x: x[0])
-        else:
-            sorted_students = sorted(students_data.items(), key=lambda x: x[1]['avg'])
-        
-        # 写表头
-        headers = ['', '高二一调', '校次', '高二期中', '', '']
-        for col_idx, header in enumerate(headers):
-            ws.write(0, col_idx, header)
-        
-        # 写标签行
-        labels = ['姓名', '得分', '校次', '总分', '校次', '均值']
-        for col_idx, label in enumerate(labels):
-            ws.write(1, col_idx, label)
-        
-        # 写数据
-        row_idx = 2
-        for name, data in sorted_students:
-            ws.write(row_idx, 0, name)
-            ws.write(row_idx, 1, data['score1'] if data['score1'] else '')
-            ws.write(row_idx, 2, data['rank1'] if data['rank1'] else '')
-            ws.write(row_idx, 3, data['score2'] if data['score2'] else '')
-            ws.write(row_idx, 4, data['rank2'] if data['rank2'] else '')
-            ws.write(row_idx, 5, data['avg'] if data['avg'] != 9999 else '')
-            row_idx += 1
+        ExcelHandler._emit_rows(ws, ExcelHandler._prepare_rows(average.sheet_rows(sort_by_name)))
     
     @staticmethod
-    def get_file_info(file_path: str) -> Dict:
+    def get_file_info(file_path: str, file_contents: Optional[bytes] = None, cache_rows: bool = True) -> Dict:
         """
         获取文件信息
+        只统计行列数和姓名列；转换要用的工作表（EXAM_KEYWORDS）顺带缓存行数据，
+        随后的 read_excel_file 不再重复解码
+        file_contents 不为空时从内存中的文件内容读取
+        cache_rows=False 时只读元数据（转换在其他进程中进行，缓存的行数据用不到）
         """
         try:
-            workbook = xlrd.open_workbook(file_path)
-            sheets_info = []
-            
-            for sheet_idx in range(workbook.nsheets):
-                sheet = workbook.sheet_by_index(sheet_idx)
-                
-                # 统计学生数量（数据从第2行开始）
-                student_count = 0
-                for row_idx in range(1, sheet.nrows):
-                    if sheet.cell(row_idx, 1).value:  # 有姓名
-                        student_count += 1
-                
-                sheets_info.append({
-                    'name': sheet.name,
-                    'rows': sheet.nrows,
-                    'cols': sheet.ncols,
-                    'student_count': student_count
-                })
-            
-            return {
-                'success': True,
-                'sheets': sheets_info,
-                'total_sheets': workbook.nsheets
-            }
+            if file_contents is not None:
+                workbook = ExcelHandler.load_contents(file_contents, file_path)
+            else:
+                workbook = ExcelHandler.load_workbook(file_path)
+            return workbook.info(ExcelHandler.EXAM_KEYWORDS if cache_rows else None)
         except Exception as e:
             return {
                 'success': False,
@@ -0,0 +1,36 @@
+"""
+gunicorn 配置
+
+用法: gunicorn -c gunicorn.conf.py wsgi:app
+可用环境变量调整：BIND、GUNICORN_THREADS、CONVERT_PROCESSES、GUNICORN_TIMEOUT
+"""
+import multiprocessing
+import os
+
+# 在主进程中预先导入表格库，worker 启动时不再导入，第一个请求不会变慢
+import numpy  # noqa: F401
+import openpyxl  # noqa: F401
+import xlrd  # noqa: F401
+import xlwt  # noqa: F401
+
+import excel_handler  # noqa: F401
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# 任务状态、上传缓存保存在进程内存中，轮询必须落到同一个进程：只开一个 worker。
+# 不使用 preload_app：任务线程和清理线程要在 worker 中创建（fork 不会复制线程）
+workers = 1
+# 请求处理线程：上传、轮询、下载都是 I/O，转换不在请求线程中执行
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+# 转换是 CPU 密集型，在独立的进程池中执行，默认每个 CPU 核一个进程
+os.environ.setdefault('CONVERT_PROCESSES', str(multiprocessing.cpu_count()))
+
+# 请求本身很快（转换在后台），超时只需覆盖大文件上传
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
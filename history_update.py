@@ -0,0 +1,374 @@
+"""
+成绩导入转换工具 - 增量更新历次成绩
+在已生成的历次成绩工作簿（write_excel_file 的输出，如 data/22历次成绩.xls）中追加新的考试：
+合并表在末尾追加新考试的行，均值表由均值工作表中已有的校次加上新考试的校次得出，
+之前各次考试的工作表只复制、不再解析和对齐
+
+用法:
+    python -m history_update data/22历次成绩.xls 新考试.xls
+    python -m history_update data/22历次成绩.xls 新考试.xls --sheet 高二期末 -o downloads/历次成绩.xls
+"""
+import argparse
+import os
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import xlwt
+
+from excel_handler import ExamSheet, ExcelHandler, RankAverage, StudentIndex, XlsxWorkbook
+
+# 合并历次考试的工作表（追加新考试的行），第二张按打印格式写出
+MERGED_SHEETS = ('历次成绩原始', '历次成绩打印')
+NAME_SORTED_SHEET = '均值 姓名排序'
+ASCENDING_SUFFIX = '均值 升序'
+
+
+class MeanRankState:
+    """
+    均值工作表中的状态
+
+    每个学生各次考试的（得分, 校次）原值，以及校次的合计和次数；
+    追加一次考试只对齐新考试的学生并累加其校次，不需要之前各次考试的数据。
+    学生按规范化的姓名对齐，均值工作表有班级列时按（班级, 姓名）对齐，
+    同名学生按出现次序对应（均值工作表中没有学号）
+    """
+
+    def __init__(self, exam_names: List[str], subject: str = '总分', with_class: bool = False):
+        self.exam_names = list(exam_names)
+        self.subject = subject
+        self.names: List[str] = []
+        # 有班级列时为各学生的班级
+        self.classes: Optional[List] = [] if with_class else None
+        self.positions: Dict[Tuple, int] = {}
+        # cells[i]：第 i 名学生各次考试的（得分, 校次）原值，依次排列
+        self.cells: List[List] = []
+        self.totals = np.zeros(0)
+        self.counts = np.zeros(0, dtype=np.intp)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    @staticmethod
+    def _rank_number(value) -> float:
+        """校次转为浮点数，缺失、非数值和 0 记为 NaN（与 RankAverage 一致）"""
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                return np.nan
+        return float(value) if value else np.nan
+
+    @staticmethod
+    def base_key(name, class_name=None) -> Tuple:
+        """对齐用的键（不含第几次出现）：(规范化班级, 规范化姓名)，没有班级列时为 (规范化姓名,)"""
+        if class_name is None:
+            return (StudentIndex.normalize(name),)
+        return (StudentIndex.normalize(class_name), StudentIndex.normalize(name))
+
+    def _position(self, name: str, seen: Dict[Tuple, int], class_name=None) -> int:
+        """学生序号，第一次出现的学生追加到名单末尾（之前各次考试记为缺考）"""
+        base = self.base_key(name, class_name if self.classes is not None else None)
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        key = base + (occurrence,)
+        position = self.positions.get(key)
+        if position is None:
+            position = len(self.names)
+            self.positions[key] = position
+            self.names.append(name)
+            if self.classes is not None:
+                self.classes.append(class_name)
+            self.cells.append(['', ''] * len(self.exam_names))
+        return position
+
+    @staticmethod
+    def has_class_column(sheet: ExamSheet) -> bool:
+        """均值工作表是否有班级列（RankAverage.header_rows 的两种布局）"""
+        labels = sheet.data[1] if len(sheet.data) >= 2 else []
+        if labels and labels[-1] == '均值':
+            if labels[0] == '姓名':
+                return False
+            if labels[:2] == ['班级', '姓名']:
+                return True
+        raise ValueError(f"工作表「{sheet.name}」不是均值工作表")
+
+    @classmethod
+    def from_sheet(cls, sheet: ExamSheet, order: Optional[Sequence[Tuple]] = None) -> 'MeanRankState':
+        """
+        从均值工作表（RankAverage.sheet_rows 的输出）读取状态
+        order 为学生首次出现的顺序（合并表中的 base_key + (第几次出现,)），
+        均值相同时按此顺序排列，与完整生成时的顺序一致
+        """
+        data = sheet.data
+        with_class = cls.has_class_column(sheet)
+        lead = 2 if with_class else 1
+        n_exams = (len(data[1]) - lead - 1) // 2
+        state = cls([str(data[0][lead + exam_idx * 2]) for exam_idx in range(n_exams)], with_class=with_class)
+
+        rows = [row for row in data[2:] if len(row) > lead - 1 and row[lead - 1]]
+        classes = [row[0] for row in rows] if with_class else [None] * len(rows)
+        if order is not None:
+            first_seen: Dict[Tuple, int] = {}
+            for key in order:
+                first_seen.setdefault(key, len(first_seen))
+            # 姓名排序的表中同名学生按首次出现的顺序排列，依次对应第 0、1…… 次出现
+            occurrences: Dict[Tuple, int] = {}
+            keys = []
+            for row, class_name in zip(rows, classes):
+                base = cls.base_key(row[lead - 1], class_name)
+                occurrences[base] = occurrences.get(base, 0) + 1
+                keys.append(first_seen.get(base + (occurrences[base] - 1,), len(first_seen)))
+            ordered = sorted(zip(keys, rows, classes), key=lambda item: item[0])
+            rows = [row for _, row, _ in ordered]
+            classes = [class_name for _, _, class_name in ordered]
+
+        seen: Dict[Tuple, int] = {}
+        ranks = np.full((len(rows), n_exams), np.nan)
+        for row, class_name in zip(rows, classes):
+            position = state._position(str(row[lead - 1]), seen, class_name)
+            state.cells[position] = list(row[lead:lead + n_exams * 2])
+            for exam_idx in range(n_exams):
+                ranks[position, exam_idx] = cls._rank_number(row[lead + 1 + exam_idx * 2])
+        present = ~np.isnan(ranks)
+        state.counts = present.sum(axis=1)
+        state.totals = np.where(present, ranks, 0.0).sum(axis=1)
+        return state
+
+    def add_exam(self, exam: ExamSheet):
+        """追加一次考试：对齐新考试的学生，累加校次"""
+        exam.schema.rank_col(self.subject, exam.name)
+        columns = exam.columns
+        ranks = RankAverage._numeric_ranks(columns, self.subject)
+        ranks[ranks == 0] = np.nan
+
+        if self.classes is not None:
+            class_cols = StudentIndex._columns_for([exam], None, StudentIndex.CLASS_HEADERS)
+            if class_cols is None:
+                raise ValueError(f"工作表「{exam.name}」没有班级列，与历次成绩的均值表不一致")
+            class_col = class_cols[0]
+            classes = [exam.data[row_idx][class_col] if class_col < len(exam.data[row_idx]) else ''
+                       for row_idx in columns.rows]
+        else:
+            classes = [None] * len(columns)
+
+        n_old = len(self)
+        seen: Dict[Tuple, int] = {}
+        positions = np.array([self._position(name, seen, class_name)
+                              for name, class_name in zip(columns.names, classes)], dtype=np.intp)
+        self.exam_names.append(exam.name)
+
+        # 新考试中没有成绩的学生补空
+        filled = np.zeros(len(self), dtype=bool)
+        for student_idx, position in enumerate(positions):
+            score = columns.value(self.subject, student_idx)
+            rank = columns.value(self.subject, student_idx, is_rank=True)
+            self.cells[position] += [score if score else '', rank if rank else '']
+            filled[position] = True
+        for position in np.flatnonzero(~filled):
+            self.cells[position] += ['', '']
+
+        self.totals = np.concatenate([self.totals, np.zeros(len(self) - n_old)])
+        self.counts = np.concatenate([self.counts, np.zeros(len(self) - n_old, dtype=np.intp)])
+        present = ~np.isnan(ranks)
+        np.add.at(self.totals, positions[present], ranks[present])
+        np.add.at(self.counts, positions[present], 1)
+
+    def means(self, min_exams: Optional[int] = None) -> np.ndarray:
+        """各学生的校次均值，校次不足 min_exams 次（默认为考试次数）时为 NaN"""
+        required = max(1, len(self.exam_names) if min_exams is None else min_exams)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts >= required, self.totals / self.counts, np.nan)
+
+    def sheet_rows(self, sort_by_name: bool, min_exams: Optional[int] = None) -> List[List]:
+        """均值工作表的全部行（与 RankAverage.sheet_rows 相同的格式和排序）"""
+        means = self.means(min_exams)
+        if sort_by_name:
+            order = np.argsort(np.array(self.names, dtype=str), kind='stable')
+        else:
+            order = np.argsort(means, kind='stable')
+        rows = RankAverage.header_rows(self.exam_names, with_class=self.classes is not None)
+        for student_idx in order:
+            mean = means[student_idx]
+            lead = [self.names[student_idx]] if self.classes is None else \
+                [self.classes[student_idx], self.names[student_idx]]
+            rows.append(lead + self.cells[student_idx] + [float(mean) if mean == mean else ''])
+        return rows
+
+
+class HistoryWorkbook:
+    """
+    已生成的历次成绩工作簿
+
+    读取时不解析各次考试的学生（parse_students=False），均值状态取自"均值 姓名排序"工作表；
+    追加考试（add_exam）只解析新考试；保存时其他工作表原样复制
+    """
+
+    def __init__(self, sheets: List[ExamSheet]):
+        self.sheets = sheets
+        by_name = {sheet.name: sheet for sheet in sheets}
+        if MERGED_SHEETS[0] not in by_name or NAME_SORTED_SHEET not in by_name:
+            raise ValueError(f"不是历次成绩工作簿：缺少「{MERGED_SHEETS[0]}」或「{NAME_SORTED_SHEET}」工作表")
+        self.merged = by_name[MERGED_SHEETS[0]]
+        name_sorted = by_name[NAME_SORTED_SHEET]
+        order = self._first_seen(self.merged, MeanRankState.has_class_column(name_sorted))
+        self.state = MeanRankState.from_sheet(name_sorted, order)
+        self.new_exams: List[ExamSheet] = []
+
+    @staticmethod
+    def _first_seen(merged: ExamSheet, with_class: bool = False) -> List[Tuple]:
+        """
+        合并表中学生出现的顺序：MeanRankState.base_key + (在该次考试中第几次出现,)
+        各次考试按考试名称列区分（没有该列时整张表视为一次考试）；
+        with_class 时按（班级, 姓名）区分
+        """
+        schema = merged.schema
+        name_col, exam_col = schema.name_col, schema.exam_col
+        class_col = None
+        if with_class:
+            class_cols = StudentIndex._columns_for([merged], None, StudentIndex.CLASS_HEADERS)
+            class_col = class_cols[0] if class_cols is not None else None
+        seen: Dict[Tuple, int] = {}
+        keys = []
+        for row in merged.data[merged.data_start:]:
+            if len(row) <= name_col or not row[name_col]:
+                continue
+            class_name = None
+            if with_class:
+                class_name = row[class_col] if class_col is not None and class_col < len(row) else ''
+            base = MeanRankState.base_key(row[name_col], class_name)
+            exam = row[exam_col] if exam_col is not None and exam_col < len(row) else ''
+            occurrence = seen.get((exam,) + base, 0)
+            seen[(exam,) + base] = occurrence + 1
+            keys.append(base + (occurrence,))
+        return keys
+
+    @classmethod
+    def load(cls, file_path: str, file_contents: Optional[bytes] = None) -> 'HistoryWorkbook':
+        return cls(ExcelHandler.read_excel_file(file_path, parse_students=False, file_contents=file_contents))
+
+    @property
+    def exam_names(self) -> List[str]:
+        return self.state.exam_names
+
+    def add_exam(self, exam: ExamSheet):
+        """追加一次考试（科目列须与合并表一致）"""
+        if exam.name in self.exam_names:
+            raise ValueError(f"考试「{exam.name}」已在历次成绩中")
+        if exam.schema.layout != self.merged.schema.layout:
+            raise ValueError(f"工作表「{exam.name}」的科目列与「{self.merged.name}」不一致，无法合并")
+        placeholder = next((sheet for sheet in self.sheets if sheet.name == exam.name), None)
+        if placeholder is not None and placeholder.data_start < len(placeholder.data):
+            raise ValueError(f"工作簿中已有名为「{exam.name}」的工作表")
+        self.state.add_exam(exam)
+        self.new_exams.append(exam)
+
+    def save(self, output_path, min_exams: Optional[int] = None, output_format: str = 'xls'):
+        """
+        写出更新后的工作簿：合并表追加新考试的行，新考试的工作表放在原有考试之后，
+        重新生成两张均值表；同名的空白工作表（如"高一期末"空表）由新考试替换
+        """
+        if output_format not in ExcelHandler.OUTPUT_FORMATS:
+            raise ValueError(f"不支持的输出格式: {output_format}")
+        workbook = XlsxWorkbook() if output_format == 'xlsx' else xlwt.Workbook(encoding='utf-8')
+        new_names = {exam.name for exam in self.new_exams}
+        new_rows = [list(ExcelHandler._prepare_rows(exam.data[exam.data_start:])) for exam in self.new_exams]
+
+        old_exams = set(self.exam_names[:len(self.exam_names) - len(self.new_exams)])
+        sheets = [sheet for sheet in self.sheets
+                  if sheet.name not in new_names and sheet.name != NAME_SORTED_SHEET
+                  and not sheet.name.endswith(ASCENDING_SUFFIX)]
+        # 新考试放在最后一次原有考试之后（没有考试工作表时放在最后）
+        insert_at = max((idx + 1 for idx, sheet in enumerate(sheets) if sheet.name in old_exams),
+                        default=len(sheets))
+
+        # 原始表和打印表内容相同时（本工具生成的文件）只预处理一次
+        prepared: List[Tuple[List[List], List[List[Tuple]]]] = []
+        for sheet_idx, sheet in enumerate(sheets):
+            if sheet_idx == insert_at:
+                self._write_new_exams(workbook)
+            if sheet.name in MERGED_SHEETS:
+                rows = next((rows for data, rows in prepared if data == sheet.data), None)
+                if rows is None:
+                    rows = list(ExcelHandler._merge_rows(ExcelHandler._prepare_rows(sheet.data), new_rows))
+                    prepared.append((sheet.data, rows))
+                setup = ExcelHandler._setup_print_sheet if sheet.name == MERGED_SHEETS[1] else None
+                ExcelHandler._write_rows_sheet(workbook, sheet.name, rows, setup=setup,
+                                               ncols=max((len(cells) for cells in rows), default=0))
+            else:
+                ExcelHandler._write_single_sheet(workbook, sheet.name, ExcelHandler._prepare_rows(sheet.data))
+        if insert_at == len(sheets):
+            self._write_new_exams(workbook)
+
+        for sort_by_name in (True, False):
+            sheet_name = (NAME_SORTED_SHEET if sort_by_name
+                          else ExcelHandler.ascending_sheet_name(len(self.exam_names)))
+            rows = self.state.sheet_rows(sort_by_name, min_exams)
+            ExcelHandler._write_single_sheet(workbook, sheet_name, ExcelHandler._prepare_rows(rows))
+        workbook.save(output_path)
+
+    def _write_new_exams(self, workbook):
+        for exam in self.new_exams:
+            ExcelHandler._write_single_sheet(workbook, exam.name, ExcelHandler._prepare_rows(exam.data))
+
+
+def update_history(history_path: str, exam_path: str, output_path: str,
+                   sheet_names: Optional[Sequence[str]] = None, min_exams: Optional[int] = None,
+                   output_format: str = 'xls') -> List[str]:
+    """
+    把 exam_path 中的考试追加到历次成绩工作簿 history_path，写出到 output_path
+    sheet_names 为要追加的工作表，默认为历次成绩中还没有的、含有学生数据的工作表；
+    返回追加的考试名称
+    """
+    history = HistoryWorkbook.load(history_path)
+    skip = set(history.exam_names) | set(MERGED_SHEETS) | {NAME_SORTED_SHEET}
+    exams = []
+    # 指定工作表时只解码这些工作表
+    for sheet in ExcelHandler.read_excel_file(exam_path, keywords=sheet_names or None):
+        if sheet_names:
+            if sheet.name in sheet_names:
+                exams.append(sheet)
+        elif (sheet.name not in skip and not sheet.name.endswith(ASCENDING_SUFFIX)
+              and sheet.data_start < len(sheet.data)):
+            exams.append(sheet)
+    missing = set(sheet_names or ()) - {exam.name for exam in exams}
+    if missing:
+        raise ValueError(f"文件中没有工作表：{'、'.join(sorted(missing))}")
+    if not exams:
+        raise ValueError("没有需要追加的考试工作表")
+
+    for exam in exams:
+        history.add_exam(exam)
+    history.save(output_path, min_exams=min_exams, output_format=output_format)
+    return [exam.name for exam in exams]
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='在历次成绩工作簿中追加新的考试')
+    parser.add_argument('history', help='已生成的历次成绩文件（如 data/22历次成绩.xls）')
+    parser.add_argument('exam_file', help='包含新考试工作表的文件')
+    parser.add_argument('--sheet', action='append', dest='sheets',
+                        help='要追加的工作表名称（可重复；默认为历次成绩中还没有的工作表）')
+    parser.add_argument('-o', '--output', help='输出文件（默认为 <历次成绩文件名>_更新.<格式>）')
+    parser.add_argument('--min-exams', type=int, default=None,
+                        help='至少有几次考试的校次才计算均值（默认为考试次数）')
+    parser.add_argument('--format', dest='output_format', choices=ExcelHandler.OUTPUT_FORMATS,
+                        default='xls', help='输出格式（默认 xls）')
+    args = parser.parse_args(argv)
+
+    output = args.output
+    if output is None:
+        base_name = os.path.splitext(args.history)[0]
+        output = f"{base_name}_更新.{args.output_format}"
+    try:
+        added = update_history(args.history, args.exam_file, output, args.sheets,
+                               args.min_exams, args.output_format)
+    except (OSError, ValueError) as e:
+        print(f"更新失败: {e}")
+        return 1
+    print(f"已追加 {'、'.join(added)}，输出到 {os.path.abspath(output)}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
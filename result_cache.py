@@ -0,0 +1,203 @@
+"""
+成绩导入转换工具 - 转换结果缓存
+以上传内容的 SHA-256 和转换选项为键，同一个文件重复上传时直接返回已有的结果
+"""
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+from excel_handler import ExcelHandler
+
+# 输出格式变化时修改，使旧的缓存结果失效
+CACHE_VERSION = 2
+
+
+class ResultCache:
+    """
+    转换结果缓存（保存在 downloads/ 下的缓存目录中；cache_dir 为空时只保存在内存中，用于内存模式）
+
+    - 键：SHA-256(文件内容) + 转换选项（按 write_excel_file 的默认值补全，见 normalize_options）
+    - 缓存文件按输出格式使用对应的扩展名（.xls / .xlsx），转换时的警告信息（如重复出现的学生）
+      一起保存（<键>.json），命中时与结果一起返回
+    - 按最近使用顺序淘汰（LRU），总大小不超过 max_bytes，
+      超过 max_age 秒未使用的结果视为过期
+    - hits / misses 记录命中次数
+    """
+
+    EXTENSIONS = ('xls', 'xlsx')
+
+    def __init__(self, cache_dir: Optional[str], max_bytes: int = 512 * 1024 * 1024,
+                 max_age: float = 7 * 24 * 3600):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # 键 -> (大小, 最近使用时间, 扩展名, 内存中的结果, 警告信息)，按最近使用顺序排列；
+        # 保存在磁盘上时内存中的结果为 None
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._scan()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.cache_dir is None
+
+    def _scan(self):
+        """启动时载入已有的缓存文件（按修改时间作为最近使用时间）"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            key, _, extension = name.rpartition('.')
+            if extension in self.EXTENSIONS and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, key, extension, stat.st_size))
+        for used, key, extension, size in sorted(entries):
+            if key in self._entries:
+                # 同一个键只保留最近的文件
+                old_size, _, old_extension, _, _ = self._entries.pop(key)
+                self._size -= old_size
+                self._unlink(key, old_extension)
+            self._entries[key] = (size, used, extension, None, self._read_warnings(key))
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    @staticmethod
+    def normalize_options(options: Optional[Dict]) -> Dict:
+        """
+        按 ExcelHandler.write_excel_file 的默认值补全转换选项，使结果相同的选项得到相同的键：
+        序列统一为列表，值为 None 的选项去掉，exam_order 默认为 EXAM_KEYWORDS
+        """
+        parameters = inspect.signature(ExcelHandler.write_excel_file).parameters
+        normalized = {name: parameter.default for name, parameter in parameters.items()
+                      if parameter.default is not inspect.Parameter.empty}
+        normalized['exam_order'] = ExcelHandler.EXAM_KEYWORDS
+        normalized.update(options or {})
+        return {name: list(value) if isinstance(value, (list, tuple)) else value
+                for name, value in normalized.items() if value is not None}
+
+    @staticmethod
+    def make_key(source: Union[str, bytes], options: Optional[Dict] = None) -> str:
+        """计算缓存键：source 为文件路径或文件内容"""
+        digest = hashlib.sha256()
+        if isinstance(source, (bytes, bytearray)):
+            digest.update(source)
+        else:
+            with open(source, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    digest.update(chunk)
+        digest.update(json.dumps([CACHE_VERSION, ResultCache.normalize_options(options)], sort_keys=True,
+                                 ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.{extension}')
+
+    def _read_warnings(self, key: str) -> List[str]:
+        try:
+            with open(self._path(key, 'json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def get(self, key: str) -> Optional[Tuple[Union[str, bytes], List[str]]]:
+        """
+        命中时更新使用时间，返回 (缓存文件路径（内存缓存为文件内容）, 警告信息)；未命中返回 None
+        """
+        with self._lock:
+            self._evict()
+            entry = self._entries.get(key)
+            if entry is None or (entry[3] is None and not os.path.exists(self._path(key, entry[2]))):
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            size, _, extension, data, warnings = entry
+            self._entries[key] = (size, time.time(), extension, data, warnings)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return (data if data is not None else self._path(key, extension)), list(warnings)
+
+    def put(self, key: str, result: Union[str, bytes], extension: str = 'xls', warnings: Sequence[str] = ()):
+        """保存转换结果：result 为输出文件路径或文件内容，extension 为输出格式，warnings 为警告信息"""
+        if extension not in self.EXTENSIONS:
+            raise ValueError(f"不支持的输出格式: {extension}")
+        data = None
+        if self.in_memory:
+            if isinstance(result, (bytes, bytearray)):
+                data = bytes(result)
+            else:
+                with open(result, 'rb') as f:
+                    data = f.read()
+            size = len(data)
+        else:
+            path = self._path(key, extension)
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            if isinstance(result, (bytes, bytearray)):
+                with open(tmp_path, 'wb') as f:
+                    f.write(result)
+            else:
+                shutil.copyfile(result, tmp_path)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+            if warnings:
+                with open(self._path(key, 'json'), 'w', encoding='utf-8') as f:
+                    json.dump(list(warnings), f, ensure_ascii=False)
+            else:
+                self._unlink(key, 'json')
+
+        with self._lock:
+            if key in self._entries:
+                old_size, _, old_extension, _, _ = self._entries[key]
+                self._size -= old_size
+                if old_extension != extension and not self.in_memory:
+                    self._unlink(key, old_extension)
+            self._entries[key] = (size, time.time(), extension, data, list(warnings))
+            self._entries.move_to_end(key)
+            self._size += size
+            self._evict()
+
+    def _unlink(self, key: str, extension: str):
+        try:
+            os.remove(self._path(key, extension))
+        except FileNotFoundError:
+            pass
+
+    def _remove(self, key: str):
+        size, _, extension, data, _ = self._entries.pop(key)
+        self._size -= size
+        if data is None:
+            self._unlink(key, extension)
+            self._unlink(key, 'json')
+
+    def _evict(self):
+        """删除过期的结果，总大小超过上限时删除最久未使用的结果"""
+        expire_before = time.time() - self.max_age
+        while self._entries:
+            key, (size, used, _, _, _) = next(iter(self._entries.items()))
+            if used >= expire_before and self._size <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def stats(self) -> Dict:
+        """命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._entries),
+                'bytes': self._size
+            }
@@ -4,10 +4,11 @@
 """
 import sys
 import os
+import re
 from pathlib import Path
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QPushButton, QLabel, QFileDialog, QTextEdit, QGroupBox,
+    QPushButton, QLabel, QFileDialog, QTextEdit, QGroupBox, QLineEdit,
     QProgressBar, QMessageBox, QTableWidget, QTableWidgetItem,
     QHeaderView, QSplitter
 )
@@ -22,10 +23,12 @@ class ProcessThread(QThread):
     status = Signal(str)
     finished = Signal(bool, str)
     
-    def __init__(self, input_file: str, output_file: str):
+    def __init__(self, input_file: str, output_file: str, exam_order: list = None):
         super().__init__()
         self.input_file = input_file
         self.output_file = output_file
+        # 考试顺序（名称关键字），为空时使用 EXAM_KEYWORDS
+        self.exam_order = exam_order or list(ExcelHandler.EXAM_KEYWORDS)
     
     def run(self):
         try:
@@ -33,14 +36,19 @@ class ProcessThread(QThread):
             self.progress.emit(30)
             
             # 读取 Excel 文件
-            sheets = ExcelHandler.read_excel_file(self.input_file)
+            sheets = ExcelHandler.read_excel_file(self.input_file, keywords=self.exam_order)
             
             self.status.emit(f"已读取 {len(sheets)} 个工作表")
             self.progress.emit(60)
             
             # 写入输出文件
             self.status.emit("正在生成输出文件...")
-            ExcelHandler.write_excel_file(sheets, self.output_file)
+            # 输出文件扩展名为 .xlsx 时写出 xlsx（不受 xls 65536 行的限制）
+            output_format = 'xlsx' if self.output_file.lower().endswith('.xlsx') else 'xls'
+            warnings = ExcelHandler.write_excel_file(sheets, self.output_file, exam_order=self.exam_order,
+                                                     output_format=output_format)
+            for warning in warnings:
+                self.status.emit(f"注意：{warning}")
             
             self.progress.emit(100)
             self.status.emit("处理完成！")
@@ -136,6 +144,14 @@ class MainWindow(QMainWindow):
         output_layout.addWidget(self.btn_select_output)
         file_layout.addLayout(output_layout)
         
+        # 考试顺序
+        order_layout = QHBoxLayout()
+        order_layout.addWidget(QLabel("考试顺序:"))
+        self.exam_order_edit = QLineEdit(' '.join(ExcelHandler.EXAM_KEYWORDS))
+        self.exam_order_edit.setPlaceholderText("工作表名称关键字，按先后顺序用空格分隔，如：一调 期中 期末")
+        order_layout.addWidget(self.exam_order_edit, 1)
+        file_layout.addLayout(order_layout)
+        
         file_group.setLayout(file_layout)
         main_layout.addWidget(file_group)
         
@@ -258,12 +274,12 @@ class MainWindow(QMainWindow):
             self,
             "设置输出 Excel 文件",
             self.output_file if self.output_file else "",
-            "Excel Files (*.xls);;All Files (*)"
+            "Excel 97-2003 (*.xls);;Excel (*.xlsx);;All Files (*)"
         )
         
         if file_path:
-            # 确保文件扩展名是 .xls
-            if not file_path.endswith('.xls'):
+            # 确保文件扩展名是 .xls 或 .xlsx
+            if not file_path.lower().endswith(('.xls', '.xlsx')):
                 file_path += '.xls'
             
             self.output_file = file_path
@@ -301,13 +317,17 @@ class MainWindow(QMainWindow):
         self.btn_process.setEnabled(False)
         self.btn_select_input.setEnabled(False)
         self.btn_select_output.setEnabled(False)
+        self.exam_order_edit.setEnabled(False)
         
         # 显示进度条
         self.progress_bar.setVisible(True)
         self.progress_bar.setValue(0)
         
+        exam_order = [keyword for keyword in re.split(r'[\s,，、]+', self.exam_order_edit.text()) if keyword]
+        self.log(f"考试顺序: {' → '.join(exam_order or ExcelHandler.EXAM_KEYWORDS)}")
+        
         # 启动处理线程
-        self.process_thread = ProcessThread(self.input_file, self.output_file)
+        self.process_thread = ProcessThread(self.input_file, self.output_file, exam_order)
         self.process_thread.progress.connect(self.update_progress)
         self.process_thread.status.connect(self.log)
         self.process_thread.finished.connect(self.process_finished)
@@ -330,6 +350,7 @@ class MainWindow(QMainWindow):
         self.btn_process.setEnabled(True)
         self.btn_select_input.setEnabled(True)
         self.btn_select_output.setEnabled(True)
+        self.exam_order_edit.setEnabled(True)
         
         # 重置进度条
         self.progress_bar.setValue(0)
@@ -0,0 +1,402 @@
+"""
+成绩导入转换工具 - 成绩库（SQLite，可选）
+把 read_excel_file 解析出的考试存入本地 SQLite 数据库，每个工作表只解码、入库一次；
+之后生成输出文件和跨学期查询（如某个学生历次的校次走势）直接查库，不再重复解码原始工作簿
+
+用法:
+    python -m score_store --db scores.db ingest data/22高二一调.xls data/22高二期中.xls
+    python -m score_store --db scores.db exams
+    python -m score_store --db scores.db trend 柴艺萱 --subject 总分
+    python -m score_store --db scores.db export 高二一调 高二期中 -o downloads/历次成绩.xls
+    python -m score_store --db scores.db export --source data/22高二期中.xls -o downloads/历次成绩.xls
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from excel_handler import ExamSheet, ExcelHandler, StudentIndex
+from history_update import ASCENDING_SUFFIX, MERGED_SHEETS, NAME_SORTED_SHEET
+
+# 表结构变化时修改，旧的数据库需要重新入库
+SCHEMA_VERSION = 2
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS source (
+    id INTEGER PRIMARY KEY,
+    sha256 TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exam (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    source_id INTEGER NOT NULL REFERENCES source(id),
+    seq INTEGER NOT NULL,
+    header TEXT NOT NULL,
+    UNIQUE (source_id, name)
+);
+CREATE TABLE IF NOT EXISTS subject (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS student (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exam_row (
+    exam_id INTEGER NOT NULL REFERENCES exam(id),
+    row_idx INTEGER NOT NULL,
+    student_id INTEGER REFERENCES student(id),
+    data TEXT NOT NULL,
+    PRIMARY KEY (exam_id, row_idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS score (
+    exam_id INTEGER NOT NULL REFERENCES exam(id),
+    student_id INTEGER NOT NULL REFERENCES student(id),
+    subject_id INTEGER NOT NULL REFERENCES subject(id),
+    score REAL,
+    rank REAL,
+    score_text TEXT,
+    rank_text TEXT,
+    PRIMARY KEY (exam_id, subject_id, student_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_score_student ON score (student_id, subject_id, exam_id);
+CREATE INDEX IF NOT EXISTS idx_score_rank ON score (exam_id, subject_id, rank);
+CREATE INDEX IF NOT EXISTS idx_student_name ON student (name_key);
+CREATE INDEX IF NOT EXISTS idx_source_path ON source (path);
+'''
+
+
+class ScoreStore:
+    """
+    成绩库
+
+    - source：已入库的文件（按内容的 SHA-256 识别，已入库的工作表不再重复解码）；
+      同一路径的文件内容变化后重新入库时，替换该文件原来的全部考试
+    - exam：考试，在同一个文件内名称唯一（不同班级的文件可以有同名考试），保存表头行，seq 为入库顺序
+    - student：学生，键与 StudentIndex 相同（学号，或 (班级, 姓名)，加上第几次出现）
+    - exam_row：考试工作表的数据行原样保存，用于还原 ExamSheet、生成输出文件
+    - score：各科得分和校次（数值；"缺考"等文本另存在 *_text 列），按学生、按校次建有索引
+
+    连接不在线程间共享，每个线程各自创建 ScoreStore
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute('PRAGMA foreign_keys = ON')
+        if db_path != ':memory:':
+            self.conn.execute('PRAGMA journal_mode = WAL')
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            self.conn.close()
+            raise ValueError(f"成绩库 {db_path} 的版本（{version}）与当前版本（{SCHEMA_VERSION}）不一致，请重新入库")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            self.conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self) -> 'ScoreStore':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def file_digest(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def is_output_sheet(name: str) -> bool:
+        """历次成绩输出中的合并表、尖子生表和均值表（不是考试）"""
+        return name in MERGED_SHEETS or name == NAME_SORTED_SHEET or name.endswith(ASCENDING_SUFFIX) \
+            or name.startswith('尖子生成绩')
+
+    @staticmethod
+    def is_exam_sheet(sheet: ExamSheet) -> bool:
+        """有学生数据的考试工作表（跳过历次成绩输出中的合并表、尖子生表和均值表）"""
+        if ScoreStore.is_output_sheet(sheet.name):
+            return False
+        return sheet.data_start < len(sheet.data) and bool(sheet.schema.subjects)
+
+    def ingest_file(self, file_path: str, keywords: Optional[Sequence] = None) -> List[str]:
+        """
+        把文件中的考试工作表入库，返回考试名称
+        keywords 不为空时只入库名称包含其中任一关键字的工作表；
+        内容相同的文件已经入库时只解码其中还没有入库的工作表（如换了 keywords），已入库的直接返回
+        """
+        sha256 = self.file_digest(file_path)
+        row = self.conn.execute('SELECT id FROM source WHERE sha256 = ?', (sha256,)).fetchone()
+        if row is None:
+            sheets = ExcelHandler.read_excel_file(file_path, keywords=keywords)
+            return self.ingest([sheet for sheet in sheets if self.is_exam_sheet(sheet)], file_path, sha256)
+
+        source_id = row[0]
+        workbook = ExcelHandler.load_workbook(file_path)
+        wanted = [name for name in workbook.names()
+                  if not keywords or any(keyword in name for keyword in keywords)]
+        stored = set(self._source_exams(source_id))
+        missing = [name for name in wanted if name not in stored and not self.is_output_sheet(name)]
+        if missing:
+            # load 按关键字（包含）匹配，再按名称精确筛选
+            sheets = [sheet for sheet in workbook.load(missing)
+                      if sheet.name in missing and self.is_exam_sheet(sheet)]
+            if sheets:
+                with self.conn:
+                    self._ingest_sheets(self.conn.cursor(), sheets, source_id, {})
+        return [name for name in self._source_exams(source_id) if name in wanted]
+
+    def _source_exams(self, source_id: int) -> List[str]:
+        """文件中已入库的考试名称（按入库顺序）"""
+        return [name for name, in self.conn.execute(
+            'SELECT name FROM exam WHERE source_id = ? ORDER BY seq, id', (source_id,))]
+
+    def ingest(self, sheets: Sequence[ExamSheet], source_path: str = '', sha256: Optional[str] = None) -> List[str]:
+        """
+        把 read_excel_file 的结果入库（一个事务），返回考试名称
+        学生用 StudentIndex 在这些考试间对齐，键相同的学生与库中已有的学生合并
+        """
+        if sha256 is None:
+            sha256 = hashlib.sha256(json.dumps([[sheet.name, sheet.data] for sheet in sheets],
+                                               ensure_ascii=False).encode('utf-8')).hexdigest()
+        path = os.path.abspath(source_path) if source_path else ''
+        with self.conn:
+            cursor = self.conn.cursor()
+            if cursor.execute('SELECT 1 FROM source WHERE sha256 = ?', (sha256,)).fetchone() is not None:
+                return [name for name, in cursor.execute(
+                    'SELECT exam.name FROM exam JOIN source ON source.id = exam.source_id '
+                    'WHERE source.sha256 = ? ORDER BY exam.seq', (sha256,))]
+            # 同一路径的旧版本：删除其考试和来源记录（保留考试原来的顺序），之后可以重新入库
+            seqs = self._drop_sources(cursor, path) if path else {}
+            cursor.execute('INSERT INTO source (sha256, path, ingested) VALUES (?, ?, ?)',
+                           (sha256, path, time.time()))
+            self._ingest_sheets(cursor, sheets, cursor.lastrowid, seqs)
+        return [sheet.name for sheet in sheets]
+
+    def _ingest_sheets(self, cursor: sqlite3.Cursor, sheets: Sequence[ExamSheet], source_id: int,
+                       seqs: Dict[str, int]):
+        """把同一文件中的考试入库，学生用 StudentIndex 对齐；seqs 为替换的考试原来的顺序"""
+        index = StudentIndex(sheets)
+        student_ids = self._student_ids(cursor, index)
+        for exam_idx, sheet in enumerate(sheets):
+            self._ingest_exam(cursor, sheet, source_id, seqs.get(sheet.name),
+                              index.exam_students[exam_idx], student_ids)
+
+    @staticmethod
+    def _drop_sources(cursor: sqlite3.Cursor, path: str) -> Dict[str, int]:
+        """删除该路径已入库的文件及其考试，返回 {考试名称: seq}"""
+        seqs = {}
+        for source_id, in cursor.execute('SELECT id FROM source WHERE path = ?', (path,)).fetchall():
+            for exam_id, name, seq in cursor.execute(
+                    'SELECT id, name, seq FROM exam WHERE source_id = ?', (source_id,)).fetchall():
+                seqs.setdefault(name, seq)
+                cursor.execute('DELETE FROM score WHERE exam_id = ?', (exam_id,))
+                cursor.execute('DELETE FROM exam_row WHERE exam_id = ?', (exam_id,))
+                cursor.execute('DELETE FROM exam WHERE id = ?', (exam_id,))
+            cursor.execute('DELETE FROM source WHERE id = ?', (source_id,))
+        return seqs
+
+    @staticmethod
+    def _student_ids(cursor: sqlite3.Cursor, index: StudentIndex) -> List[int]:
+        """StudentIndex 中各学生在库中的 ID（新学生插入）"""
+        keys = [json.dumps(key, ensure_ascii=False) for key in index.keys]
+        cursor.executemany('INSERT OR IGNORE INTO student (key, name, name_key) VALUES (?, ?, ?)',
+                           ((key, name, StudentIndex.normalize(name)) for key, name in zip(keys, index.names)))
+        ids = {}
+        # 分批查询，避免超过 SQLite 的参数个数上限
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(batch))
+            ids.update(cursor.execute(f'SELECT key, id FROM student WHERE key IN ({placeholders})', batch))
+        return [ids[key] for key in keys]
+
+    def _ingest_exam(self, cursor: sqlite3.Cursor, sheet: ExamSheet, source_id: int, seq: Optional[int],
+                     positions: Sequence[int], student_ids: List[int]):
+        """入库一次考试，seq 为空时排在最后"""
+        if seq is None:
+            seq = cursor.execute('SELECT COALESCE(MAX(seq), 0) + 1 FROM exam').fetchone()[0]
+        header = json.dumps(sheet.data[:sheet.data_start], ensure_ascii=False)
+        cursor.execute('INSERT INTO exam (name, source_id, seq, header) VALUES (?, ?, ?, ?)',
+                       (sheet.name, source_id, seq, header))
+        exam_id = cursor.lastrowid
+
+        columns = sheet.columns
+        row_students = {row_idx: student_ids[positions[idx]] for idx, row_idx in enumerate(columns.rows)}
+        cursor.executemany(
+            'INSERT INTO exam_row (exam_id, row_idx, student_id, data) VALUES (?, ?, ?, ?)',
+            ((exam_id, row_idx, row_students.get(row_idx), json.dumps(sheet.data[row_idx], ensure_ascii=False))
+             for row_idx in range(sheet.data_start, len(sheet.data))))
+
+        for subject in columns.subjects:
+            cursor.execute('INSERT OR IGNORE INTO subject (name) VALUES (?)', (subject,))
+            subject_id = cursor.execute('SELECT id FROM subject WHERE name = ?', (subject,)).fetchone()[0]
+            cursor.executemany(
+                'INSERT INTO score (exam_id, student_id, subject_id, score, score_text, rank, rank_text) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                ((exam_id, student_ids[positions[idx]], subject_id) +
+                 self._split(columns.value(subject, idx)) + self._split(columns.value(subject, idx, is_rank=True))
+                 for idx in range(len(columns)))
+            )
+
+    @staticmethod
+    def _split(value) -> Tuple[Optional[float], Optional[str]]:
+        """单元格值拆为 (数值, 文本)，空值为 (None, None)"""
+        if value is None or value == '':
+            return None, None
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value), None
+        return None, str(value)
+
+    def exams(self) -> List[Dict]:
+        """已入库的考试（按入库顺序）"""
+        return [{'name': name, 'student_count': count, 'source': path}
+                for name, count, path in self.conn.execute(
+                    'SELECT exam.name, COUNT(exam_row.student_id), source.path FROM exam '
+                    'JOIN source ON source.id = exam.source_id '
+                    'LEFT JOIN exam_row ON exam_row.exam_id = exam.id '
+                    'GROUP BY exam.id ORDER BY exam.seq, exam.id')]
+
+    def rank_trend(self, name: str, subject: str = '总分') -> List[Dict]:
+        """
+        学生历次考试的得分和校次（按考试入库顺序）
+        同名的不同学生（键不同）各自返回，用 student_key 区分；source 为考试所在的文件
+        """
+        rows = self.conn.execute(
+            'SELECT student.key, student.name, exam.name, source.path, score.score, score.rank, '
+            '       score.score_text, score.rank_text '
+            'FROM student '
+            'JOIN score ON score.student_id = student.id '
+            'JOIN subject ON subject.id = score.subject_id AND subject.name = ? '
+            'JOIN exam ON exam.id = score.exam_id '
+            'JOIN source ON source.id = exam.source_id '
+            'WHERE student.name_key = ? ORDER BY student.id, exam.seq, exam.id',
+            (subject, StudentIndex.normalize(name)))
+        return [{'student_key': key, 'name': student, 'exam': exam, 'source': path,
+                 'score': score if score is not None else score_text,
+                 'rank': rank if rank is not None else rank_text}
+                for key, student, exam, path, score, rank, score_text, rank_text in rows]
+
+    def top_students(self, exam: str, subject: str = '总分', top_n: int = 20,
+                     source: Optional[str] = None) -> List[Dict]:
+        """
+        某次考试某科校次最靠前的学生，同名次按表中顺序（同 select_top_students 的 ties='first'），
+        没有数值校次的学生不列出
+        同名考试来自多个文件（如各班分别入库）时合在一起按校次排列，source 不为空时只取该文件
+        """
+        sql = ('SELECT student.name, score.score, score.rank FROM score '
+               'JOIN exam ON exam.id = score.exam_id AND exam.name = ? '
+               'JOIN source ON source.id = exam.source_id '
+               'JOIN subject ON subject.id = score.subject_id AND subject.name = ? '
+               'JOIN student ON student.id = score.student_id '
+               'JOIN exam_row ON exam_row.exam_id = exam.id AND exam_row.student_id = student.id '
+               'WHERE score.rank IS NOT NULL')
+        params = [exam, subject]
+        if source is not None:
+            sql += ' AND source.path = ?'
+            params.append(os.path.abspath(source))
+        sql += ' ORDER BY CAST(score.rank AS INTEGER), exam.seq, exam.id, exam_row.row_idx LIMIT ?'
+        rows = self.conn.execute(sql, params + [top_n])
+        return [{'name': name, 'score': score, 'rank': rank} for name, score, rank in rows]
+
+    def _exam_rows(self, exam_id: int) -> Iterator[List]:
+        for data, in self.conn.execute('SELECT data FROM exam_row WHERE exam_id = ? ORDER BY row_idx',
+                                       (exam_id,)):
+            yield json.loads(data)
+
+    def load_exams(self, names: Optional[Sequence[str]] = None, source: Optional[str] = None) -> List[ExamSheet]:
+        """
+        从库中还原考试工作表（与 read_excel_file 的结果相同），可直接交给 write_excel_file
+        names 为空时返回全部考试，否则按 names 的顺序返回；
+        source 不为空时只取该文件中的考试，否则同名考试来自多个文件时报错
+        """
+        sql = 'SELECT exam.id, exam.name, exam.header, source.path FROM exam ' \
+              'JOIN source ON source.id = exam.source_id'
+        params = []
+        if source is not None:
+            sql += ' WHERE source.path = ?'
+            params.append(os.path.abspath(source))
+        exams, paths = {}, {}
+        for exam_id, name, header, path in self.conn.execute(sql + ' ORDER BY exam.seq, exam.id', params):
+            exams.setdefault(name, (exam_id, header))
+            paths.setdefault(name, []).append(path)
+        names = list(names) if names else list(exams)
+        missing = [name for name in names if name not in exams]
+        if missing:
+            where = f"文件 {source} 中" if source is not None else '成绩库中'
+            raise ValueError(f"{where}没有考试：{'、'.join(missing)}")
+        ambiguous = [name for name in names if len(paths[name]) > 1]
+        if ambiguous:
+            raise ValueError(f"考试 {'、'.join(ambiguous)} 来自多个文件"
+                             f"（{'、'.join(sorted(set(p for name in ambiguous for p in paths[name])))}），请指定文件")
+        sheets = []
+        for name in names:
+            exam_id, header = exams[name]
+            sheets.append(ExamSheet(name, json.loads(header) + list(self._exam_rows(exam_id))))
+        return sheets
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description='成绩库：入库、查询和导出')
+    parser.add_argument('--db', default='scores.db', help='数据库文件（默认 scores.db）')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    ingest = commands.add_parser('ingest', help='把文件中的考试入库')
+    ingest.add_argument('files', nargs='+')
+    ingest.add_argument('-k', '--keyword', action='append', dest='keywords',
+                        help='只入库名称包含该关键字的工作表（可重复）')
+
+    commands.add_parser('exams', help='列出已入库的考试')
+
+    trend = commands.add_parser('trend', help='学生历次考试的得分和校次')
+    trend.add_argument('name')
+    trend.add_argument('--subject', default='总分')
+
+    export = commands.add_parser('export', help='用库中的考试生成历次成绩文件')
+    export.add_argument('exams', nargs='*', help='考试名称（按先后顺序，默认为全部考试）')
+    export.add_argument('--source', help='只导出该文件中的考试（同名考试来自多个文件时需要指定）')
+    export.add_argument('-o', '--output', required=True)
+    export.add_argument('--format', dest='output_format', choices=ExcelHandler.OUTPUT_FORMATS, default='xls')
+    args = parser.parse_args(argv)
+
+    try:
+        with ScoreStore(args.db) as store:
+            if args.command == 'ingest':
+                for file_path in args.files:
+                    names = store.ingest_file(file_path, args.keywords)
+                    print(f"{file_path}: {'、'.join(names) or '没有新的考试工作表'}")
+            elif args.command == 'exams':
+                for exam in store.exams():
+                    print(f"{exam['name']}\t{exam['student_count']} 人\t{exam['source']}")
+            elif args.command == 'trend':
+                for row in store.rank_trend(args.name, args.subject):
+                    print(f"{row['name']}\t{row['exam']}\t{row['score']}\t{row['rank']}\t{row['source']}")
+            else:
+                sheets = store.load_exams(args.exams, source=args.source)
+                # 按给出的顺序排列考试，不按名称关键字
+                warnings = ExcelHandler.write_excel_file(sheets, args.output,
+                                                         exam_order=[sheet.name for sheet in sheets],
+                                                         output_format=args.output_format)
+                for warning in warnings:
+                    print(f"注意：{warning}")
+                print(f"已导出到 {os.path.abspath(args.output)}")
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"操作失败: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -34,6 +34,7 @@ setup(
         "xlrd>=2.0.1",
         "xlwt>=1.3.0",
         "openpyxl>=3.1.0",
+        "numpy>=1.24.0",
     ],
     entry_points={
         "console_scripts": [
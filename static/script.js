@@ -5,6 +5,12 @@
 let currentFile = null;
 let currentFilePath = null;
 let currentOutputFilename = null;
+let currentUploadId = null;      // 内存模式下的上传 ID
+let currentDownloadUrl = null;
+let currentOutputPath = null;    // 输出文件相对下载目录的路径（含任务目录）
+
+// 轮询转换任务状态的间隔（毫秒）
+const POLL_INTERVAL = 500;
 
 // 页面加载完成
 document.addEventListener('DOMContentLoaded', function() {
@@ -103,7 +109,8 @@ function uploadFile(file) {
     .then(response => response.json())
     .then(data => {
         if (data.success) {
-            currentFilePath = data.filepath;
+            currentFilePath = data.filepath || null;
+            currentUploadId = data.upload_id || null;
             displayFileInfo(data);
             hideProgress();
         } else {
@@ -148,7 +155,7 @@ function displayFileInfo(data) {
  * 转换文件
  */
 function convertFile() {
-    if (!currentFilePath) {
+    if (!currentFilePath && !currentUploadId) {
         showError('请先选择文件');
         return;
     }
@@ -157,40 +164,64 @@ function convertFile() {
     document.querySelectorAll('.btn').forEach(btn => btn.disabled = true);
     
     // 显示进度
-    showProgress('转换中...');
-    updateProgress(30);
+    showProgress('提交中...');
     
-    // 发送转换请求
+    // 提交转换任务，服务器立即返回任务 ID
     fetch('/api/convert', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
         body: JSON.stringify({
-            filepath: currentFilePath
+            filepath: currentFilePath,
+            upload_id: currentUploadId
         })
     })
     .then(response => response.json())
     .then(data => {
-        updateProgress(100);
-        
         if (data.success) {
+            pollJob(data.job_id);
+        } else {
+            showError(data.error || '转换失败');
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showError('转换失败: ' + error.message);
+    });
+}
+
+/**
+ * 轮询转换任务状态，直到完成或失败
+ */
+function pollJob(jobId) {
+    fetch(`/api/jobs/${encodeURIComponent(jobId)}`)
+    .then(response => response.json())
+    .then(data => {
+        if (data.status === 'done') {
+            updateProgress(100);
             currentOutputFilename = data.output_filename;
+            currentOutputPath = data.output_path || null;
+            currentDownloadUrl = data.download_url;
+            document.querySelectorAll('.btn').forEach(btn => btn.disabled = false);
+            // 警告信息（如同一次考试中重复出现的学生）附在结果后面
+            const warnings = data.warnings || [];
+            const message = warnings.length ? `${data.message}（注意：${warnings.join('；')}）` : data.message;
             setTimeout(() => {
                 hideProgress();
-                showSuccess(data.message);
+                showSuccess(message);
             }, 500);
-        } else {
+        } else if (data.status === 'failed' || !data.success) {
             showError(data.error || '转换失败');
+        } else {
+            document.getElementById('progressText').textContent = data.message;
+            updateProgress(data.progress);
+            setTimeout(() => pollJob(jobId), POLL_INTERVAL);
         }
     })
     .catch(error => {
         console.error('Error:', error);
-        showError('转换失败: ' + error.message);
-    })
-    .finally(() => {
-        // 启用按钮
-        document.querySelectorAll('.btn').forEach(btn => btn.disabled = false);
+        showError('查询转换进度失败: ' + error.message);
     });
 }
 
@@ -203,9 +234,7 @@ function downloadFile() {
         return;
     }
     
-    const url = `/api/download/${encodeURIComponent(currentOutputFilename)}`;
-    
-    fetch(url)
+    fetch(currentDownloadUrl)
         .then(response => {
             if (!response.ok) {
                 throw new Error('下载失败: ' + response.statusText);
@@ -237,6 +266,13 @@ function downloadFile() {
  * 重置表单
  */
 function resetForm() {
+    // 记下当前文件，用于清理
+    const cleanupRequest = {
+        filepath: currentFilePath,
+        upload_id: currentUploadId,
+        output_path: currentOutputPath
+    };
+    
     // 隐藏所有部分
     document.getElementById('infoSection').style.display = 'none';
     document.getElementById('actionSection').style.display = 'none';
@@ -251,10 +287,17 @@ function resetForm() {
     currentFile = null;
     currentFilePath = null;
     currentOutputFilename = null;
+    currentUploadId = null;
+    currentDownloadUrl = null;
+    currentOutputPath = null;
     
-    // 清理临时文件
+    // 清理当前文件（其他用户的文件不受影响）
     fetch('/api/cleanup', {
-        method: 'POST'
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(cleanupRequest)
     })
     .catch(error => console.error('Cleanup error:', error));
 }
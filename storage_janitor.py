@@ -0,0 +1,136 @@
+"""
+成绩导入转换工具 - 临时文件清理
+后台线程定期清理 uploads/ 和 downloads/：超过保存期限的文件被删除，
+总大小超过配额时按最近使用顺序删除最旧的文件；正在转换的文件不会被删除
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+class StorageJanitor:
+    """
+    临时文件清理
+
+    - ttls: {目录: 文件保存期限（秒）}，按文件的修改时间计算；
+      下载时调用 touch() 刷新时间，即最近使用时间
+    - max_bytes: 所有目录的总配额，超出时删除最久未使用的文件（LRU）
+    - in_use: 判断文件（绝对路径）是否正在被转换任务使用，使用中的文件不删除
+    - min_age: 刚写入不久的文件（如刚上传、尚未提交转换）不删除
+    - 以 "." 开头的子目录（如结果缓存 .cache）由各自的模块管理，这里跳过
+    """
+
+    def __init__(self, ttls: Dict[str, float], max_bytes: int, interval: float = 300,
+                 min_age: float = 60, in_use: Optional[Callable[[str], bool]] = None,
+                 on_remove: Optional[Callable[[str], None]] = None):
+        self.ttls = {os.path.abspath(folder): ttl for folder, ttl in ttls.items()}
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.min_age = min_age
+        self.in_use = in_use or (lambda path: False)
+        self.on_remove = on_remove
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台清理线程（重复调用无效）"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='storage-janitor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"清理临时文件失败: {e}")
+
+    @staticmethod
+    def touch(path: str):
+        """记录文件被使用（刷新修改时间），使其在 LRU 中排到最后"""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _scan(self) -> Tuple[List[Tuple[str, int, float, float]], List[str]]:
+        """返回 ([(路径, 大小, 修改时间, 保存期限)], [子目录])"""
+        files = []
+        dirs = []
+        for folder, ttl in self.ttls.items():
+            if not os.path.isdir(folder):
+                continue
+            for root, subdirs, names in os.walk(folder):
+                subdirs[:] = [name for name in subdirs if not name.startswith('.')]
+                dirs.extend(os.path.join(root, name) for name in subdirs)
+                for name in names:
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((path, stat.st_size, stat.st_mtime, ttl))
+        return files, dirs
+
+    def _remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+        except OSError:
+            return False
+        if self.on_remove is not None:
+            self.on_remove(path)
+        return True
+
+    def remove(self, path: str) -> bool:
+        """删除单个文件（使用中的文件不删除），返回是否已删除"""
+        path = os.path.abspath(path)
+        if self.in_use(path) or not os.path.isfile(path) or not self._remove(path):
+            return False
+        # 每个任务一个目录时，目录空了一并删除（不删除管理的根目录）
+        parent = os.path.dirname(path)
+        if parent not in self.ttls and any(parent.startswith(folder + os.sep) for folder in self.ttls):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                pass
+        return True
+
+    def sweep(self) -> Dict:
+        """清理一次，返回删除的文件数和字节数"""
+        with self._lock:
+            now = time.time()
+            files, dirs = self._scan()
+            total = sum(size for _, size, _, _ in files)
+            removed = 0
+            removed_bytes = 0
+
+            # 可以删除的文件：未被使用且不是刚写入的，按最近使用时间从旧到新
+            candidates = sorted((entry for entry in files
+                                 if now - entry[2] >= self.min_age and not self.in_use(entry[0])),
+                                key=lambda entry: entry[2])
+            for path, size, mtime, ttl in candidates:
+                if now - mtime <= ttl and total <= self.max_bytes:
+                    continue
+                if self._remove(path):
+                    total -= size
+                    removed += 1
+                    removed_bytes += size
+
+            # 删除空的子目录（每个任务一个目录时）
+            for path in sorted(dirs, key=len, reverse=True):
+                try:
+                    if not os.listdir(path) and now - os.stat(path).st_mtime >= self.min_age:
+                        os.rmdir(path)
+                except OSError:
+                    pass
+
+        if removed:
+            print(f"已清理 {removed} 个临时文件，释放 {removed_bytes} bytes")
+        return {'removed': removed, 'removed_bytes': removed_bytes, 'total_bytes': total}
@@ -0,0 +1,57 @@
+"""测试共用的样例数据和工具函数"""
+import os
+
+import pytest
+import xlrd
+import xlwt
+
+from excel_handler import ExcelHandler
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+SAMPLE_FILE = os.path.join(DATA_DIR, '22高二期中.xls')
+
+
+def write_workbook(path, sheets):
+    """把 {工作表名称: 行列表} 写成 xls 文件"""
+    workbook = xlwt.Workbook(encoding='utf-8')
+    for name, rows in sheets.items():
+        ws = workbook.add_sheet(name)
+        for row_idx, row in enumerate(rows):
+            for col_idx, value in enumerate(row):
+                ws.write(row_idx, col_idx, value)
+    workbook.save(path)
+    return path
+
+
+def dump_workbook(path):
+    """xls 文件的全部内容：[(工作表名称, [行, ...]), ...]"""
+    workbook = xlrd.open_workbook(path)
+    return [(sheet.name, [sheet.row_values(row_idx) for row_idx in range(sheet.nrows)])
+            for sheet in workbook.sheets()]
+
+
+@pytest.fixture
+def sample_sheets():
+    """样例文件中的两次考试（高二一调、高二期中）"""
+    return ExcelHandler.read_excel_file(SAMPLE_FILE)
+
+
+@pytest.fixture
+def three_exam_file(tmp_path, sample_sheets):
+    """
+    由样例数据构造的三次考试：高二一调、高二期中，以及由高二期中变化得到的高二期末
+    （名单倒序、少 3 人、多 1 个新学生，总分校次有变化）
+    """
+    first, second = sample_sheets
+    header = second.data[:second.data_start]
+    students = [list(row) for row in second.data[second.data_start:]][::-1][3:]
+    total_rank_col = second.schema.rank_col('总分', second.name)
+    for idx, row in enumerate(students):
+        row[0] = '高二期末'
+        row[total_rank_col] = float(idx * 7 % len(students) + 1)
+    new_student = ['高二期末', '新同学'] + [100.0, 5.0] * 7
+    return write_workbook(tmp_path / 'all3.xls', {
+        first.name: first.data,
+        second.name: second.data,
+        '高二期末': header + students + [new_student],
+    })
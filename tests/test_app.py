@@ -0,0 +1,80 @@
+"""Web 接口：转换任务、转换选项检查、就绪检查"""
+import time
+
+import pytest
+
+from app import create_app, validate_options
+from conftest import SAMPLE_FILE
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = create_app({'UPLOAD_FOLDER': str(tmp_path / 'uploads'), 'DOWNLOAD_FOLDER': str(tmp_path / 'downloads'),
+                      'START_JANITOR': False})
+    yield app.test_client()
+    app.extensions['score_convert']['jobs'].shutdown()
+
+
+def _upload(client):
+    with open(SAMPLE_FILE, 'rb') as f:
+        response = client.post('/api/upload', data={'file': (f, '22.xls')})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+@pytest.mark.parametrize('options', [
+    {'top_subjects': '总分'},
+    {'top_subjects': []},
+    {'top_subjects': ['总分', '数学', '总分']},
+    {'top_n': 0},
+    {'top_n': '20'},
+    {'top_ties': 'random'},
+    {'min_exams': 0},
+    {'exam_order': '期中'},
+    {'exam_order': ['期中', '期中']},
+    {'top_exam': -1},
+    {'top_exam': True},
+    {'output_format': 'csv'},
+])
+def test_invalid_options(options):
+    assert validate_options(options)
+
+
+def test_valid_options():
+    assert validate_options({'top_n': 10, 'top_subjects': ['总分', '数学'], 'top_ties': 'include', 'min_exams': None,
+                             'exam_order': ['一调', '期中'], 'top_exam': 1, 'output_format': 'xlsx'}) is None
+
+
+def test_convert_rejects_bad_options(client):
+    upload = _upload(client)
+    for options in ({'top_subjects': '总分'}, {'top_subjects': ['总分', '总分']}, {'top_exam': 2}):
+        response = client.post('/api/convert', json={'filepath': upload['filepath'], 'options': options})
+        assert response.status_code == 400
+    assert client.post('/api/convert', json=['not', 'an', 'object']).status_code == 400
+
+
+def test_convert_and_poll(client):
+    upload = _upload(client)
+    response = client.post('/api/convert', json={'filepath': upload['filepath'], 'options': {'top_exam': 1}})
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+    for _ in range(200):
+        status = client.get(status_url).get_json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.05)
+    assert status['status'] == 'done', status.get('error')
+    assert status['warnings'] == []
+    assert client.get(status['download_url']).status_code == 200
+
+
+def test_ready(client):
+    response = client.get('/api/ready')
+    assert response.status_code == 200
+    assert response.get_json()['checks']['process_pool'] is True
+
+
+def test_download_missing_file(client):
+    response = client.get('/api/download/job/missing.xls')
+    assert response.status_code == 404
+    assert response.get_json()['error'] == '文件不存在'
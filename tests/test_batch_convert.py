@@ -0,0 +1,39 @@
+"""批量转换：输出路径"""
+import os
+
+import pytest
+
+from batch_convert import collect_files, convert_one, output_paths
+from conftest import SAMPLE_FILE
+
+
+def test_output_paths_same_directory(tmp_path):
+    files = [str(tmp_path / 'a.xls'), str(tmp_path / 'b.xlsx')]
+    outputs = output_paths(files, 'out', 'xlsx')
+    assert outputs == {files[0]: os.path.join('out', '转换_a.xlsx'), files[1]: os.path.join('out', '转换_b.xlsx')}
+
+
+def test_output_paths_mirror_directories(tmp_path):
+    files = [str(tmp_path / '1班' / '成绩.xls'), str(tmp_path / '2班' / '成绩.xls')]
+    outputs = output_paths(files, 'out')
+    assert outputs[files[0]] == os.path.join('out', '1班', '转换_成绩.xls')
+    assert outputs[files[1]] == os.path.join('out', '2班', '转换_成绩.xls')
+
+
+def test_output_paths_collision(tmp_path):
+    with pytest.raises(ValueError):
+        output_paths([str(tmp_path / 'a.xls'), str(tmp_path / 'a.xlsx')], 'out')
+
+
+def test_collect_skips_outputs(tmp_path):
+    for name in ('a.xls', '转换_a.xls', 'notes.txt', '~$a.xls'):
+        (tmp_path / name).write_bytes(b'')
+    assert collect_files([str(tmp_path)]) == [str(tmp_path / 'a.xls')]
+
+
+def test_convert_one_with_exam_order(tmp_path, three_exam_file):
+    output = str(tmp_path / 'sub' / 'out.xls')
+    result = convert_one(str(three_exam_file), output, exam_order=['一调', '期中', '期末'])
+    assert result['success'], result['error']
+    assert os.path.exists(output)
+    assert convert_one(SAMPLE_FILE, str(tmp_path / 'two.xls'))['warnings'] == []
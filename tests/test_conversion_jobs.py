@@ -0,0 +1,91 @@
+"""转换任务：考试顺序选项、结果缓存、进程池"""
+import os
+import time
+
+import pytest
+
+import conversion_jobs
+from conftest import SAMPLE_FILE, dump_workbook
+from conversion_jobs import JOB_DONE, JOB_FAILED, JobManager
+from excel_handler import ExcelHandler
+from result_cache import ResultCache
+
+
+def _wait(jobs, job_id, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job['status'] in (JOB_DONE, JOB_FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError('转换任务超时')
+
+
+def _crash(*args):
+    os._exit(1)
+
+
+def _raise_os_error():
+    raise OSError('无法创建子进程')
+
+
+@pytest.fixture
+def jobs():
+    manager = JobManager(max_workers=1)
+    yield manager
+    manager.shutdown()
+
+
+def test_job_uses_exam_order(tmp_path, jobs, three_exam_file):
+    output = str(tmp_path / 'out.xls')
+    job = _wait(jobs, jobs.submit(str(three_exam_file), output, options={'exam_order': ['期中', '期末']}))
+    assert job['status'] == JOB_DONE, job['error']
+    names = [name for name, _ in dump_workbook(output)]
+    assert '高二期末' in names and '高二一调' not in names
+
+
+def test_in_memory_job_uses_cache(tmp_path, monkeypatch):
+    """内存模式：结果缓存在内存中，命中时直接返回文件内容，不写磁盘"""
+    monkeypatch.chdir(tmp_path)
+    jobs = JobManager(max_workers=1, cache=ResultCache(None))
+    try:
+        with open(SAMPLE_FILE, 'rb') as f:
+            workbook = ExcelHandler.load_contents(f.read(), 'a.xls')
+        options = {'output_format': 'xlsx'}
+        first = _wait(jobs, jobs.submit(workbook, output_filename='a.xlsx', options=options))
+        second = _wait(jobs, jobs.submit(workbook, output_filename='a.xlsx', options=options))
+        assert not first['cached'] and second['cached']
+        assert second['result'] == first['result'] and first['result'][:2] == b'PK'
+        assert os.listdir(tmp_path) == []
+    finally:
+        jobs.shutdown()
+
+
+def test_process_pool_recovers_from_crash(tmp_path, monkeypatch, three_exam_file):
+    jobs = JobManager(processes=1)
+    try:
+        monkeypatch.setattr(conversion_jobs, 'convert_in_process', _crash)
+        failed = _wait(jobs, jobs.submit(str(three_exam_file), str(tmp_path / 'a.xls')))
+        assert failed['status'] == JOB_FAILED
+        assert jobs.pool_healthy and jobs.stats()['pool_restarts'] == 1
+
+        monkeypatch.undo()
+        options = {'exam_order': ['一调', '期中', '期末']}
+        done = _wait(jobs, jobs.submit(str(three_exam_file), str(tmp_path / 'b.xls'), options=options))
+        assert done['status'] == JOB_DONE, done['error']
+        assert '3次 均值 升序' in [name for name, _ in dump_workbook(tmp_path / 'b.xls')]
+    finally:
+        jobs.shutdown()
+
+
+def test_pool_unhealthy_when_restart_fails(tmp_path, monkeypatch, three_exam_file):
+    jobs = JobManager(processes=1)
+    try:
+        monkeypatch.setattr(conversion_jobs, 'convert_in_process', _crash)
+        monkeypatch.setattr(jobs, '_new_process_pool', _raise_os_error)
+        assert jobs.pool_healthy
+        failed = _wait(jobs, jobs.submit(str(three_exam_file), str(tmp_path / 'a.xls')))
+        assert failed['status'] == JOB_FAILED
+        assert not jobs.pool_healthy and jobs.stats()['pool_restarts'] == 0
+    finally:
+        jobs.shutdown()
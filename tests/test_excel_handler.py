@@ -0,0 +1,182 @@
+"""ExcelHandler：列布局识别、未解析的工作表、尖子生筛选、考试顺序、学生索引、xlsx 输出"""
+import os
+
+import openpyxl
+import pytest
+
+from conftest import DATA_DIR, dump_workbook, write_workbook
+from excel_handler import ExamSheet, ExcelHandler, SheetSchema, StudentIndex
+
+
+def test_unparsed_sheets_rejected(tmp_path):
+    sheets = ExcelHandler.read_excel_file(os.path.join(DATA_DIR, '22高二期中.xls'), parse_students=False)
+    with pytest.raises(ValueError):
+        sheets[0].columns
+    with pytest.raises(ValueError):
+        ExcelHandler.write_excel_file(sheets, str(tmp_path / 'out.xls'))
+
+
+def _ranked_sheet(ranks):
+    header = ['', '姓名', '总分', '校次']
+    return ExamSheet('高二一调', [header] + [['高二一调', f'学生{idx}', 500.0, rank]
+                                         for idx, rank in enumerate(ranks)])
+
+
+def test_select_top_students_ties():
+    sheet = _ranked_sheet([3.0, 1.0, 2.0, 2.0, 5.0, '缺考'])
+
+    def data_rows(rows):
+        return [row - sheet.data_start for row in rows]
+
+    first = ExcelHandler.select_top_students(sheet, top_n=2, ties='first')['总分']
+    assert data_rows(first) == [1, 2]
+    included = ExcelHandler.select_top_students(sheet, top_n=2, ties='include')['总分']
+    assert data_rows(included) == [1, 2, 3]
+    everyone = ExcelHandler.select_top_students(sheet, top_n=10)['总分']
+    # 没有数值校次的学生排在最后
+    assert data_rows(everyone)[-1] == 5
+    with pytest.raises(ValueError):
+        ExcelHandler.select_top_students(sheet, ties='random')
+
+
+def test_top_exam_out_of_range(tmp_path, sample_sheets):
+    with pytest.raises(ValueError):
+        ExcelHandler.write_excel_file(sample_sheets, str(tmp_path / 'out.xls'), top_exam=2)
+
+
+def test_duplicate_top_subjects_rejected(tmp_path, sample_sheets):
+    with pytest.raises(ValueError):
+        ExcelHandler.write_excel_file(sample_sheets, str(tmp_path / 'out.xls'), top_subjects=['总分', '总分'])
+
+
+def test_exam_order_selects_sheets(tmp_path, three_exam_file):
+    """exam_order 中的关键字决定读取哪些工作表以及先后顺序"""
+    sheets = ExcelHandler.read_excel_file(str(three_exam_file), keywords=['期末', '期中'])
+    assert [sheet.name for sheet in sheets] == ['高二期中', '高二期末']
+    output = tmp_path / 'out.xls'
+    ExcelHandler.write_excel_file(sheets, str(output), exam_order=['期末', '期中'])
+    names = [name for name, _ in dump_workbook(output)]
+    assert names.index('高二期末') < names.index('高二期中')
+    assert '两次 均值 升序' in names
+
+
+def test_student_index_duplicates():
+    header = ['', '班级', '姓名', '总分', '校次']
+    first = ExamSheet('高二一调', [header, ['高二一调', '1班', '张三', 600.0, 1.0],
+                                    ['高二一调', '1班', '张三', 590.0, 2.0],
+                                    ['高二一调', '2班', '张三', 580.0, 3.0]])
+    second = ExamSheet('高二期中', [header, ['高二期中', '2班', '张三', 600.0, 1.0],
+                                    ['高二期中', '1班', '张 三', 590.0, 2.0],
+                                    ['高二期中', '1班', '张三', 580.0, 3.0]])
+    index = StudentIndex([first, second])
+    assert len(index) == 3
+    assert index.duplicates == [('高二一调', '张三', 2), ('高二期中', '张三', 2)]
+    # 第 k 个同班同名学生对应另一次考试中的第 k 个
+    assert list(index.exam_students[1]) == [2, 0, 1]
+    assert index.classes == ['1班', '1班', '2班']
+    assert len(index.duplicate_messages()) == 2
+
+
+def test_write_reports_duplicates(tmp_path, sample_sheets):
+    first, second = sample_sheets
+    duplicated = ExamSheet(first.name, first.data + [first.data[first.data_start]])
+    warnings = ExcelHandler.write_excel_file([duplicated, second], str(tmp_path / 'out.xls'))
+    assert len(warnings) == 1 and first.data[first.data_start][1] in warnings[0]
+    assert ExcelHandler.write_excel_file(sample_sheets, str(tmp_path / 'out2.xls')) == []
+
+
+def _xlsx_rows(path, sheet_name):
+    """xlsx 工作表的全部行，取值与 xlrd 读出的 xls 一致（空单元格为 ''，数值为 float，去掉行尾空单元格）"""
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    rows = []
+    for row in workbook[sheet_name].iter_rows(values_only=True):
+        row = ['' if value is None else float(value) if isinstance(value, (int, float)) else value
+               for value in row]
+        while row and row[-1] == '':
+            row.pop()
+        rows.append(row)
+    workbook.close()
+    return rows
+
+
+def test_xlsx_output_matches_xls(tmp_path, sample_sheets):
+    ExcelHandler.write_excel_file(sample_sheets, str(tmp_path / 'out.xls'))
+    ExcelHandler.write_excel_file(sample_sheets, str(tmp_path / 'out.xlsx'), output_format='xlsx')
+    for name, rows in dump_workbook(tmp_path / 'out.xls'):
+        expected = []
+        for row in rows:
+            row = list(row)
+            while row and row[-1] == '':
+                row.pop()
+            expected.append(row)
+        assert _xlsx_rows(tmp_path / 'out.xlsx', name) == expected, name
+
+
+SUBJECTS = ['语文', '数学', '英语', '政治', '历史', '地理', '总分']
+
+
+def _exam_rows(exam_name, students):
+    """班级、学号、姓名之后是各科（得分, 校次）"""
+    header = ['', '班级', '学号', '姓名'] + [value for subject in SUBJECTS for value in (subject, '校次')]
+    rows = [header]
+    for idx, (class_name, name) in enumerate(students):
+        rows.append([exam_name, class_name, 1000 + idx, name] +
+                    [value for _ in SUBJECTS for value in (90.0 - idx, float(idx + 1))])
+    return rows
+
+
+def test_schema_detects_extra_subjects_and_class_column():
+    sheet = ExamSheet('高一一调', _exam_rows('高一一调', [('1班', '张三'), ('2班', '李四')]))
+    schema = sheet.schema
+    assert schema.name_col == 3
+    assert schema.exam_col == 0
+    assert schema.subjects == SUBJECTS
+    assert schema.columns['历史'] == (12, 13)
+    assert schema.data_start == 1
+    assert sheet.students[1]['name'] == '李四'
+    assert StudentIndex([sheet]).class_cols == [1]
+
+
+def test_schema_default_layout_matches_sample(sample_sheets):
+    for sheet in sample_sheets:
+        assert sheet.schema.layout == SheetSchema.default(sheet.data_start).layout
+
+
+def test_schema_ignores_pandas_header_suffixes():
+    """pandas 导出的表头（Unnamed: 0、校次.1）按原名识别"""
+    sheets = ExcelHandler.read_excel_file(os.path.join(DATA_DIR, 'test1.xlsx'))
+    assert sheets[0].schema.subjects == ['语文', '数学', '英语', '物理', '化学', '生物', '总分']
+    assert sheets[0].schema.rank_col('数学', sheets[0].name) == 5
+
+
+def test_missing_rank_column_raises():
+    sheet = ExamSheet('高一一调', _exam_rows('高一一调', [('1班', '张三')]))
+    with pytest.raises(ValueError):
+        ExcelHandler.select_top_students(sheet, subjects=('物理',))
+
+
+def test_extra_subjects_written(tmp_path):
+    exam_file = write_workbook(tmp_path / 'extra.xls', {
+        name: _exam_rows(name, [('1班', f'学生{idx}') for idx in range(10)])
+        for name in ('高一一调', '高一期中')
+    })
+    output = tmp_path / 'out.xls'
+    sheets = ExcelHandler.read_excel_file(str(exam_file))
+    ExcelHandler.write_excel_file(sheets, str(output), exam_order=['一调', '期中'], top_n=3,
+                                  top_subjects=('总分', '历史'))
+    result = dict(dump_workbook(output))
+    assert len(result['尖子生成绩']) == 1 + 3
+    assert len(result['尖子生成绩 历史']) == 1 + 3
+    assert result['均值 姓名排序'][1][:2] == ['班级', '姓名']
+
+
+def test_cached_workbook_returns_fresh_sheets(tmp_path):
+    path = write_workbook(tmp_path / 'exam.xls', {'高一一调': _exam_rows('高一一调', [('1班', '张三')])})
+    workbook = ExcelHandler.load_workbook(str(path))
+    assert ExcelHandler.load_workbook(str(path)) is workbook
+    first, second = workbook.load()[0], workbook.load()[0]
+    assert first is not second
+    first.columns
+    first.data.append(['高一一调', '1班', '李四'])
+    assert second._columns is None
+    assert len(second.data) == len(first.data) - 1
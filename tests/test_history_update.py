@@ -0,0 +1,76 @@
+"""增量追加考试（history_update）与完整重新生成的结果一致"""
+import pytest
+
+from conftest import dump_workbook, write_workbook
+from excel_handler import ExcelHandler
+from history_update import HistoryWorkbook, update_history
+
+EXAM_ORDER = ['一调', '期中', '期末']
+
+
+def _full_and_incremental(tmp_path, exam_file, sheet_names=None):
+    sheets = ExcelHandler.read_excel_file(str(exam_file))
+    full_path = tmp_path / 'full.xls'
+    ExcelHandler.write_excel_file(sheets, str(full_path), exam_order=EXAM_ORDER)
+
+    history_path = tmp_path / 'history.xls'
+    ExcelHandler.write_excel_file([sheet for sheet in sheets if sheet.name != '高二期末'], str(history_path),
+                                  exam_order=EXAM_ORDER)
+    output_path = tmp_path / 'updated.xls'
+    added = update_history(str(history_path), str(exam_file), str(output_path), sheet_names=sheet_names)
+    return added, dump_workbook(full_path), dump_workbook(output_path)
+
+
+def test_update_history_matches_full_conversion(tmp_path, three_exam_file):
+    added, full, updated = _full_and_incremental(tmp_path, three_exam_file)
+    assert added == ['高二期末']
+    assert [name for name, _ in updated] == [name for name, _ in full]
+    for (name, full_rows), (_, updated_rows) in zip(full, updated):
+        assert updated_rows == full_rows, name
+
+
+def test_update_history_selected_sheet(tmp_path, three_exam_file):
+    added, full, updated = _full_and_incremental(tmp_path, three_exam_file, sheet_names=['高二期末'])
+    assert added == ['高二期末']
+    assert updated == full
+
+
+def test_update_history_with_class_column(tmp_path):
+    """有班级列时均值表多一列班级，不同班的同名学生分开计算"""
+    subjects = ['语文', '总分']
+    header = ['', '班级', '姓名'] + [value for subject in subjects for value in (subject, '校次')]
+    rosters = {
+        '高一一调': [('1班', '张三', 3), ('2班', '张三', 1), ('1班', '李四', 2)],
+        '高一期中': [('2班', '张三', 2), ('1班', '李四', 3), ('1班', '张三', 1)],
+        '高一期末': [('1班', '张三', 2), ('1班', '李四', 1), ('2班', '张三', 3), ('3班', '王五', 4)],
+    }
+    exam_file = write_workbook(tmp_path / 'classes.xls', {
+        name: [header] + [[name, class_name, student, 100 - rank, rank, 300 - rank, rank]
+                          for class_name, student, rank in roster]
+        for name, roster in rosters.items()
+    })
+    sheets = ExcelHandler.read_excel_file(str(exam_file))
+    full_path = tmp_path / 'full.xls'
+    ExcelHandler.write_excel_file(sheets, str(full_path), exam_order=['一调', '期中', '期末'])
+    history_path = tmp_path / 'history.xls'
+    ExcelHandler.write_excel_file(sheets[:2], str(history_path))
+    output_path = tmp_path / 'updated.xls'
+    update_history(str(history_path), str(exam_file), str(output_path))
+
+    full = dict(dump_workbook(full_path))
+    assert dict(dump_workbook(output_path)) == full
+    name_sorted = full['均值 姓名排序']
+    assert name_sorted[1][:2] == ['班级', '姓名']
+    means = {(row[0], row[1]): row[-1] for row in name_sorted[2:]}
+    assert means[('1班', '张三')] == pytest.approx(2.0)
+    assert means[('2班', '张三')] == pytest.approx(2.0)
+    assert means[('3班', '王五')] == ''
+
+
+def test_add_existing_exam_rejected(tmp_path, three_exam_file):
+    sheets = ExcelHandler.read_excel_file(str(three_exam_file))
+    history_path = tmp_path / 'history.xls'
+    ExcelHandler.write_excel_file(sheets, str(history_path), exam_order=EXAM_ORDER)
+    history = HistoryWorkbook.load(str(history_path))
+    with pytest.raises(ValueError):
+        history.add_exam(sheets[0])
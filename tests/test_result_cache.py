@@ -0,0 +1,66 @@
+"""转换结果缓存"""
+import os
+import time
+
+from result_cache import ResultCache
+
+
+def test_cache_hit_and_extension(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'))
+    key = ResultCache.make_key(b'workbook', {'output_format': 'xlsx'})
+    assert cache.get(key) is None
+    cache.put(key, b'PK-result', 'xlsx', warnings=['重复'])
+    path, warnings = cache.get(key)
+    assert path.endswith('.xlsx') and warnings == ['重复']
+    with open(path, 'rb') as f:
+        assert f.read() == b'PK-result'
+    # 重新打开时载入已有的缓存文件和警告
+    reopened = ResultCache(str(tmp_path / 'cache'))
+    assert reopened.get(key) == (path, ['重复'])
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_cache_key_depends_on_options():
+    assert ResultCache.make_key(b'a', {'top_n': 10}) != ResultCache.make_key(b'a', {'top_n': 20})
+    assert ResultCache.make_key(b'a', {'top_n': 10}) == ResultCache.make_key(b'a', {'top_n': 10})
+
+
+def test_cache_key_fills_in_defaults():
+    """不传选项与显式传入默认值的结果相同，键也相同"""
+    defaults = {'top_n': 20, 'top_subjects': ['总分'], 'top_ties': 'first', 'min_exams': None,
+                'exam_order': ['一调', '期中'], 'top_exam': 0, 'output_format': 'xls'}
+    assert ResultCache.make_key(b'a', {}) == ResultCache.make_key(b'a', defaults)
+    assert ResultCache.make_key(b'a', None) == ResultCache.make_key(b'a', {'top_subjects': ('总分',)})
+    assert ResultCache.make_key(b'a', {}) != ResultCache.make_key(b'a', {'output_format': 'xlsx'})
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=250)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, b'x' * 100)
+    # a 已被淘汰
+    assert cache.get('a') is None
+    assert cache.get('b') is not None
+    cache.put('d', b'x' * 100)
+    # b 刚被使用，淘汰的是 c
+    assert cache.get('c') is None
+    assert cache.get('b') is not None
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['b.xls', 'd.xls']
+
+
+def test_cache_expires(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_age=0.05)
+    cache.put('a', b'x')
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert os.listdir(tmp_path / 'cache') == []
+
+
+def test_memory_cache_does_not_touch_disk(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ResultCache(None, max_bytes=150)
+    cache.put('a', b'x' * 100, 'xlsx')
+    assert cache.get('a') == (b'x' * 100, [])
+    cache.put('b', b'y' * 100)
+    assert cache.get('a') is None
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,86 @@
+"""成绩库：入库、按文件区分同名考试、导出"""
+import os
+import shutil
+
+import pytest
+
+from conftest import SAMPLE_FILE
+from excel_handler import ExcelHandler
+from score_store import ScoreStore
+
+
+@pytest.fixture
+def store():
+    with ScoreStore(':memory:') as score_store:
+        yield score_store
+
+
+def _class_files(tmp_path, sample_sheets):
+    """两个班的文件，考试名称相同，学生不同"""
+    first = str(tmp_path / '1班.xls')
+    shutil.copyfile(SAMPLE_FILE, first)
+    second = str(tmp_path / '2班.xls')
+    renamed = []
+    for sheet in sample_sheets:
+        data = [list(row) for row in sheet.data]
+        for row in data[sheet.data_start:]:
+            row[sheet.schema.name_col] = '二班' + row[sheet.schema.name_col]
+        renamed.append(type(sheet)(sheet.name, data))
+    ExcelHandler.write_excel_file(renamed, second)
+    return first, second
+
+
+def test_same_exam_names_from_different_files(tmp_path, store, sample_sheets):
+    first, second = _class_files(tmp_path, sample_sheets)
+    assert store.ingest_file(first) == ['高二一调', '高二期中']
+    assert store.ingest_file(second) == ['高二一调', '高二期中']
+    assert len(store.exams()) == 4
+
+    # 第一个文件的数据没有被第二个文件覆盖，再次入库直接返回
+    assert [sheet.data for sheet in store.load_exams(source=first)] == [sheet.data for sheet in sample_sheets]
+    assert store.ingest_file(first) == ['高二一调', '高二期中']
+    with pytest.raises(ValueError):
+        store.load_exams(['高二一调'])
+
+    name = sample_sheets[0].data[sample_sheets[0].data_start][1]
+    assert {row['source'] for row in store.rank_trend(name)} == {os.path.abspath(first)}
+    assert len(store.top_students('高二一调', top_n=5, source=second)) == 5
+
+
+def test_changed_file_replaces_its_exams(tmp_path, store, sample_sheets):
+    path = str(tmp_path / 'exam.xls')
+    shutil.copyfile(SAMPLE_FILE, path)
+    store.ingest_file(path)
+    first_sheet = sample_sheets[0]
+    trimmed = type(first_sheet)(first_sheet.name, first_sheet.data[:-5])
+    ExcelHandler.write_excel_file([trimmed, sample_sheets[1]], path)
+    # 文件内容变了：原来的来源记录和考试被替换
+    assert store.ingest_file(path)
+    assert store.conn.execute('SELECT COUNT(*) FROM source').fetchone()[0] == 1
+    assert [exam['name'] for exam in store.exams()] == ['高二一调', '高二期中']
+
+    # 恢复成原来的内容后可以重新入库（不会因为 SHA-256 已见过而跳过）
+    shutil.copyfile(SAMPLE_FILE, path)
+    store.ingest_file(path)
+    assert [sheet.data for sheet in store.load_exams(source=path)] == [sheet.data for sheet in sample_sheets]
+
+
+def test_same_file_with_other_keywords(store, sample_sheets):
+    """同一个文件换了 keywords 再次入库时，只补充还没有入库的考试"""
+    assert store.ingest_file(SAMPLE_FILE, keywords=['一调']) == ['高二一调']
+    assert store.ingest_file(SAMPLE_FILE, keywords=['期中']) == ['高二期中']
+    assert store.ingest_file(SAMPLE_FILE) == ['高二一调', '高二期中']
+    assert [exam['name'] for exam in store.exams()] == ['高二一调', '高二期中']
+    assert store.conn.execute('SELECT COUNT(*) FROM source').fetchone()[0] == 1
+    assert [sheet.data for sheet in store.load_exams()] == [sheet.data for sheet in sample_sheets]
+
+
+def test_export_matches_direct_conversion(tmp_path, store, sample_sheets):
+    store.ingest_file(SAMPLE_FILE)
+    exported = str(tmp_path / 'exported.xls')
+    direct = str(tmp_path / 'direct.xls')
+    sheets = store.load_exams()
+    ExcelHandler.write_excel_file(sheets, exported, exam_order=[sheet.name for sheet in sheets])
+    ExcelHandler.write_excel_file(sample_sheets, direct)
+    with open(exported, 'rb') as a, open(direct, 'rb') as b:
+        assert a.read() == b.read()
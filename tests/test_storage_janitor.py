@@ -0,0 +1,37 @@
+"""临时文件清理"""
+import os
+import time
+
+from storage_janitor import StorageJanitor
+
+
+def _old_file(path, age, size=10):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def test_janitor_keeps_files_in_use(tmp_path):
+    uploads = tmp_path / 'uploads'
+    busy = _old_file(uploads / 'job1' / 'busy.xls', age=3600)
+    stale = _old_file(uploads / 'job2' / 'stale.xls', age=3600)
+    fresh = _old_file(uploads / 'job3' / 'fresh.xls', age=0)
+    janitor = StorageJanitor({str(uploads): 600}, max_bytes=10 ** 6, min_age=60,
+                             in_use=lambda path: path == os.path.abspath(busy))
+    assert janitor.sweep()['removed'] == 1
+    assert os.path.exists(busy) and os.path.exists(fresh) and not os.path.exists(stale)
+    assert janitor.remove(busy) is False
+
+
+def test_janitor_quota_removes_oldest_first(tmp_path):
+    downloads = tmp_path / 'downloads'
+    oldest = _old_file(downloads / 'a' / 'old.xls', age=500, size=100)
+    newer = _old_file(downloads / 'b' / 'new.xls', age=200, size=100)
+    cached = _old_file(downloads / '.cache' / 'key.xls', age=5000, size=100)
+    janitor = StorageJanitor({str(downloads): 3600}, max_bytes=150, min_age=60)
+    janitor.sweep()
+    assert not os.path.exists(oldest) and os.path.exists(newer)
+    # 结果缓存目录由 ResultCache 管理
+    assert os.path.exists(cached)
@@ -0,0 +1,9 @@
+"""
+成绩导入转换工具 - WSGI 入口（生产环境）
+
+Linux:   gunicorn -c gunicorn.conf.py wsgi:app
+Windows: waitress-serve --listen=0.0.0.0:8000 --threads=8 wsgi:app
+"""
+from app import create_app
+
+app = create_app()